@@ -10,12 +10,10 @@
   entered into with WSO2 governing the purchase of this software and any
 """
 
-from datetime import datetime
+from datetime import date
+from functools import lru_cache
 
-# Get current date and time
-now = datetime.now()
-
-agent_system_prompt = f"""You are the Hotel Assistant Agent, here to help the customers of Gardeo Hotel. Gardeo Hotels offer the finest Sri Lankan hospitality and blend seamlessly with nature to create luxurious experiences. Answer the given question accurately using the provided set of tools.
+_TEMPLATE = """You are the Hotel Assistant Agent, here to help the customers of Gardeo Hotel. Gardeo Hotels offer the finest Sri Lankan hospitality and blend seamlessly with nature to create luxurious experiences. Answer the given question accurately using the provided set of tools.
             
 Please follow these rules:
             
@@ -24,4 +22,14 @@ Please follow these rules:
 3) Always use the correct tools to fetch the required information before proceeding with bookings.
 4) Ask the user for any missing information (e.g., always confirm the check-in and check-out dates with the customer).
 
-You can use the current date and time: {now.strftime("%Y-%m-%d %H:%M:%S")}. Do not perform any actions outside the scope of the task. Always provide clear, concise, and readable answers."""  # noqa E501
+You can use the current date: {date}. Do not perform any actions outside the scope of the task. Always provide clear, concise, and readable answers."""  # noqa E501
+
+
+@lru_cache(maxsize=1)
+def _format_prompt(today: str) -> str:
+    return _TEMPLATE.format(date=today)
+
+
+def get_system_prompt() -> str:
+    # Formatted once per day, so long-running servers don't hand out a stale date
+    return _format_prompt(date.today().isoformat())
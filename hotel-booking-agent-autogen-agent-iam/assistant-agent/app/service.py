@@ -12,7 +12,10 @@
 
 import logging
 import os
-from typing import Literal, Dict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from string import Template
+from typing import Literal
 
 from fastapi.responses import HTMLResponse
 
@@ -21,16 +24,16 @@ from autogen_agentchat.messages import TextMessage
 from autogen_core import CancellationToken
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 from autogen_core.models import ModelFamily
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, HTTPException
 from pydantic import BaseModel
 from starlette.responses import HTMLResponse
-from starlette.websockets import WebSocketDisconnect
 
-from app.prompt import agent_system_prompt
+from app.prompt import get_system_prompt
 from app.tools import (
-    fetch_hotels, fetch_hotel_details, make_booking, search_hotels, fetch_hotel_reviews,
-    get_review, fetch_reviews
+    close_http_client, fetch_hotels, fetch_hotel_details, make_booking, search_hotels, fetch_hotel_reviews,
+    fetch_hotels_with_reviews, fetch_many_hotel_details, get_review, fetch_reviews, fetch_many_reviews
 )
 from autogen.tool import SecureFunctionTool
 from auth import AuthRequestMessage, AutogenAuthManager, AuthSchema, AuthConfig, OAuthTokenType
@@ -69,7 +72,15 @@ agent_config = AgentConfig(
 # Gemini configs
 gemini_api_key = os.environ.get('GEMINI_API_KEY')
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the pooled connections of the hotel API client
+    await close_http_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 class TextResponse(BaseModel):
@@ -89,17 +100,86 @@ model_client = OpenAIChatCompletionClient(
     },
 )
 
-auth_managers: Dict[str, AutogenAuthManager] = {}
-state_mapping: Dict[str, str] = {}
+# Seconds a chat session and a pending authorization flow are kept around
+SESSION_TTL = 12 * 60 * 60
+AUTH_FLOW_TTL = 10 * 60
+
+# Bounded so that abandoned sessions and unfinished authorization flows are evicted
+auth_managers: TTLCache[str, AutogenAuthManager] = TTLCache(maxsize=10_000, ttl=SESSION_TTL)
+state_mapping: TTLCache[str, str] = TTLCache(maxsize=10_000, ttl=AUTH_FLOW_TTL)
+
+
+# Create the set of tools once, as inferring their schemas is costly.
+# The public tools need no auth and are shared by all chat sessions, while the
+# booking tool is bound to each session's auth manager with SecureFunctionTool.with_auth.
+fetch_hotels_tool = SecureFunctionTool(
+    fetch_hotels,
+    description="Fetches all hotels with optional filters (city, brand, amenities, etc.)",
+    name="FetchHotelsTool"
+)
+
+search_hotels_tool = SecureFunctionTool(
+    search_hotels,
+    description="Search hotels with availability for specific dates and location",
+    name="SearchHotelsTool"
+)
+
+fetch_hotel_details_tool = SecureFunctionTool(
+    fetch_hotel_details,
+    description="Fetch detailed information about a specific hotel including rooms",
+    name="FetchHotelDetailsTool"
+)
+
+fetch_many_hotel_details_tool = SecureFunctionTool(
+    fetch_many_hotel_details,
+    description="Fetch detailed information about several hotels, including rooms, in one call",
+    name="FetchManyHotelDetailsTool"
+)
+
+fetch_hotel_reviews_tool = SecureFunctionTool(
+    fetch_hotel_reviews,
+    description="Fetch reviews for a specific hotel",
+    name="FetchHotelReviewsTool"
+)
+
+fetch_hotels_with_reviews_tool = SecureFunctionTool(
+    fetch_hotels_with_reviews,
+    description="Fetches hotels with optional filters (city, brand) together with their latest reviews in one call",
+    name="FetchHotelsWithReviewsTool"
+)
+
+fetch_reviews_tool = SecureFunctionTool(
+    fetch_reviews,
+    description="Fetch all reviews with optional filters",
+    name="FetchReviewsTool"
+)
+
+get_review_tool = SecureFunctionTool(
+    get_review,
+    description="Get details of a specific review",
+    name="GetReviewTool"
+)
+
+fetch_many_reviews_tool = SecureFunctionTool(
+    fetch_many_reviews,
+    description="Get details of several reviews in one call",
+    name="FetchManyReviewsTool"
+)
+
+protected_book_hotel_tool = SecureFunctionTool(
+    make_booking,
+    description="Books the hotel room selected by the user",
+    name="BookHotelTool"
+)
 
 
 async def run_agent(assistant: AssistantAgent, websocket: WebSocket):
-    # Start the chat loop
-    while True:
-        user_input = await websocket.receive_text()
+    # Start the chat loop, which ends when the client disconnects
+    async for user_input in websocket.iter_text():
         logger.info(f"[run_agent] Received user input: {user_input[:100]}...")
 
-        if user_input.strip().lower() == "exit":
+        # Only short messages can be the exit command, so skip normalizing the rest
+        if len(user_input) < 16 and user_input.strip().lower() == "exit":
             logger.info("[run_agent] User requested exit, closing websocket")
             await websocket.close()
             break
@@ -151,55 +231,13 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     # Store the auth manager by session_id
     auth_managers[session_id] = auth_manager
 
-    # Create the set of tools required
-    
-    fetch_hotels_tool = SecureFunctionTool(
-        fetch_hotels,
-        description="Fetches all hotels with optional filters (city, brand, amenities, etc.)",
-        name="FetchHotelsTool"
-    )
-    
-    search_hotels_tool = SecureFunctionTool(
-        search_hotels,
-        description="Search hotels with availability for specific dates and location",
-        name="SearchHotelsTool"
-    )
-
-    fetch_hotel_details_tool = SecureFunctionTool(
-        fetch_hotel_details,
-        description="Fetch detailed information about a specific hotel including rooms",
-        name="FetchHotelDetailsTool"
-    )
-    
-    fetch_hotel_reviews_tool = SecureFunctionTool(
-        fetch_hotel_reviews,
-        description="Fetch reviews for a specific hotel",
-        name="FetchHotelReviewsTool"
-    )
-    
-    fetch_reviews_tool = SecureFunctionTool(
-        fetch_reviews,
-        description="Fetch all reviews with optional filters",
-        name="FetchReviewsTool"
-    )
-    
-    get_review_tool = SecureFunctionTool(
-        get_review,
-        description="Get details of a specific review",
-        name="GetReviewTool"
-    )
+    # Bind the booking tool to the auth manager of the chat session
+    book_hotel_tool = protected_book_hotel_tool.with_auth(AuthSchema(auth_manager, AuthConfig(
+        scopes=["create_bookings"],
+        token_type=OAuthTokenType.OBO_TOKEN,
+        resource="booking_api"
+    )))
 
-    book_hotel_tool = SecureFunctionTool(
-        make_booking,
-        description="Books the hotel room selected by the user",
-        name="BookHotelTool",
-        auth=AuthSchema(auth_manager, AuthConfig(
-            scopes=["create_bookings"],
-            token_type=OAuthTokenType.OBO_TOKEN,
-            resource="booking_api"
-        ))
-    )
-    
     # Create a agent instance for the chat session
     hotel_assistant = AssistantAgent(
         "hotel_booking_assistant",
@@ -209,16 +247,19 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             fetch_hotels_tool,
             search_hotels_tool, 
             fetch_hotel_details_tool,
+            fetch_many_hotel_details_tool,
             fetch_hotel_reviews_tool,
+            fetch_hotels_with_reviews_tool,
             # Public Review Tools
             fetch_reviews_tool,
             get_review_tool,
+            fetch_many_reviews_tool,
             # Protected Booking Tools
             book_hotel_tool,
 
         ],
         reflect_on_tool_use=True,
-        system_message=agent_system_prompt)
+        system_message=get_system_prompt())
 
     # Initiate a web-socket connection
     await websocket.accept()
@@ -231,12 +272,19 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
 
         # Continue to run the agent
         await run_agent(hotel_assistant, websocket)
-    except WebSocketDisconnect:
+        # iter_text ends the chat loop quietly when the client disconnects
         print(f"Client with session_id {session_id} disconnected")
     except Exception as e:
         print(f"Error in WebSocket connection: {str(e)}")
     finally:
-        auth_managers.pop(session_id, None)
+        # A reconnect with the same session id may have registered a newer manager
+        if auth_managers.get(session_id) is auth_manager:
+            auth_managers.pop(session_id, None)
+        await auth_manager.aclose()
+
+
+# The callback page is loaded once; only the state is substituted per request
+callback_template = Template(Path(__file__).with_name("callback.html").read_text(encoding="utf-8"))
 
 
 @app.get("/callback")
@@ -254,54 +302,9 @@ async def callback(
         raise HTTPException(status_code=400, detail="Invalid session.")
 
     try:
-        token = await auth_manager.process_callback(state, code)
-
-        return HTMLResponse(
-            content=f"""
-            <html>
-            <head>
-                <title>Authorization Successful</title>
-                <script>
-                    function communicateAndClose() {{
-                        if (window.opener) {{
-                            try {{
-                                const message = {{
-                                    type: 'auth_callback',
-                                    state: '{state}'
-                                }};
-
-                                // Use postMessage to send token to opener
-                                window.opener.postMessage(message, "*");
-
-                                // Show success message
-                                document.getElementById('status').textContent = 'Authorization successful! Closing window...';
-
-                                // Close the window after a short delay
-                                setTimeout(function() {{
-                                    window.close();
-                                }}, 1500);
-                            }} catch (err) {{
-                                console.error('Error communicating with parent window:', err);
-                                document.getElementById('status').textContent = 'Error: ' + err.message;
-                            }}
-                        }} else {{
-                            document.getElementById('status').textContent = 'Cannot find opener window.';
-                        }}
-                    }}
-
-                    window.onload = communicateAndClose;
-                </script>
-            </head>
-            <body>
-                <div style="text-align: center; font-family: Arial, sans-serif; margin-top: 50px;">
-                    <h2>Authorization Successful</h2>
-                    <p id="status">Processing authorization...</p>
-                    <p>You can close this window and return to the booking assistant.</p>
-                </div>
-            </body>
-            </html>
-            """
-        )
+        await auth_manager.process_callback(state, code)
+
+        return HTMLResponse(content=callback_template.substitute(state=state))
     except Exception as e:
         logger.error(f"Error in callback: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
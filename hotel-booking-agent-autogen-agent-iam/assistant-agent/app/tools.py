@@ -10,11 +10,16 @@
   entered into with WSO2 governing the purchase of this software and any
 """
 
+import asyncio
+import hashlib
 import os
 import logging
-import traceback
+from typing import AsyncIterator, Dict, Iterator, List
 
 import httpx
+import ijson
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 from asgardeo.models import OAuthToken
@@ -25,195 +30,252 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 hotel_api_base_url = os.environ.get('HOTEL_API_BASE_URL')
-logger.info(f"[tools.py] Hotel API Base URL configured as: {hotel_api_base_url}")
+logger.info("[tools.py] Hotel API Base URL configured as: %s", hotel_api_base_url)
 
+# Hotel API endpoints without path parameters
+_PATH_HOTELS = "api/hotels"
+_PATH_HOTEL_SEARCH = "api/hotels/search"
+_PATH_BOOKINGS = "api/bookings"
+_PATH_REVIEWS = "api/reviews"
 
-async def _get(base_url: str, path: str, bearer_token: str, params: dict = None) -> dict:
-    headers = {
-        "Accept": "application/json"
-    }
-    
-    # Only add Authorization header if token is provided and not empty
-    if bearer_token and bearer_token.strip():
-        headers["Authorization"] = f"Bearer {bearer_token}"
-        logger.debug(f"[_get] Authorization header added (token length: {len(bearer_token)})")
-    else:
-        logger.debug("[_get] No bearer token provided, making unauthenticated request")
+# HTTP client shared by all the tool calls, so that connections to the hotel API are pooled and kept alive.
+# HTTP/2 multiplexes concurrent requests over a single connection, when the hotel API negotiates it.
+_http_client = httpx.AsyncClient(
+    base_url=hotel_api_base_url or "",
+    http2=True,
+    timeout=httpx.Timeout(30.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=10, keepalive_expiry=60.0)
+)
+
+
+async def close_http_client():
+    await _http_client.aclose()
+
+
+# Headers shared by all the requests of a kind, built once rather than per call
+_GET_HEADERS = {"Accept": "application/json"}
+_JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+
+
+def _bearer(token: OAuthToken) -> str:
+    # Public tools run without an auth context and receive an empty token
+    return token.access_token if token else ""
 
-    url = f"{base_url.rstrip('/')}/{path.lstrip('/')}"
-    logger.info(f"[_get] Making GET request to: {url}")
-    logger.debug(f"[_get] Request params: {params}")
+
+# Log prefixes of the request helpers
+_LOG_TAGS = {"GET": "[_get]", "POST": "[_post]", "PATCH": "[_patch]"}
+
+
+def _request_headers(bearer_token: str, has_body: bool) -> dict:
+    headers = _JSON_HEADERS if has_body else _GET_HEADERS
+    # Only add Authorization header if token is provided and not empty.
+    # The shared header dicts are never mutated, so a copy is made only when the token is added.
+    return {**headers, "Authorization": f"Bearer {bearer_token}"} if bearer_token.strip() else headers
+
+
+async def _request(method: str, path: str, bearer_token: str, data: dict = None, params: dict = None) -> dict:
+    tag = _LOG_TAGS[method]
+    headers = _request_headers(bearer_token or "", data is not None)
+    logger.debug("%s Authorization header added: %s", tag, "Authorization" in headers)
+
+    logger.info("%s Making %s request to: %s", tag, method, path)
+    # Serialize the body once up front; the same bytes are logged and sent
+    content = orjson.dumps(data) if data is not None else None
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s Request data: %s", tag, content)
+        logger.debug("%s Request params: %s", tag, params)
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=headers, params=params)
-            logger.info(f"[_get] Response status: {response.status_code} for URL: {url}")
-            
-            if response.status_code >= 400:
-                logger.error(f"[_get] HTTP error {response.status_code}: {response.text[:500]}")
-            
-            response.raise_for_status()
-            return response.json()
-    except httpx.ConnectError as e:
-        logger.error(f"[_get] Connection error to {url}: {str(e)}")
-        logger.error(f"[_get] This usually means the backend service is not running or unreachable")
-        logger.error(f"[_get] Base URL: {base_url}, Path: {path}")
-        logger.error(f"[_get] Full traceback:\n{traceback.format_exc()}")
-        raise
-    except httpx.TimeoutException as e:
-        logger.error(f"[_get] Timeout error for {url}: {str(e)}")
-        logger.error(f"[_get] Full traceback:\n{traceback.format_exc()}")
-        raise
-    except httpx.HTTPStatusError as e:
-        logger.error(f"[_get] HTTP status error for {url}: {e.response.status_code}")
-        logger.error(f"[_get] Response body: {e.response.text[:1000]}")
-        logger.error(f"[_get] Full traceback:\n{traceback.format_exc()}")
-        raise
+        # Paths are relative to the client's base URL, which httpx parses only once
+        response = await _http_client.request(method, path, headers=headers, content=content, params=params)
+        logger.info("%s Response status: %d for path: %s", tag, response.status_code, path)
+        response.raise_for_status()
+        return orjson.loads(response.content)
     except Exception as e:
-        logger.error(f"[_get] Unexpected error for {url}: {type(e).__name__}: {str(e)}")
-        logger.error(f"[_get] Full traceback:\n{traceback.format_exc()}")
+        _log_request_error(tag, path, e)
         raise
 
 
-async def _post(base_url: str, path: str, bearer_token: str, data: dict = None, params: dict = None) -> dict:
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-    
-    # Only add Authorization header if token is provided and not empty
-    if bearer_token and bearer_token.strip():
-        headers["Authorization"] = f"Bearer {bearer_token}"
-        logger.debug(f"[_post] Authorization header added (token length: {len(bearer_token)})")
+def _log_request_error(tag: str, path: str, error: Exception) -> None:
+    if isinstance(error, httpx.ConnectError):
+        # The backend service is usually not running or unreachable
+        logger.exception("%s Connection error to %s (base URL: %s)", tag, path, _http_client.base_url)
+    elif isinstance(error, httpx.TimeoutException):
+        logger.exception("%s Timeout error for %s", tag, path)
+    elif isinstance(error, httpx.HTTPStatusError):
+        # Client errors, such as a missing record or a rejected token, are expected and need no traceback
+        log = logger.warning if error.response.is_client_error else logger.exception
+        log("%s HTTP status error for %s: %d, response body: %s",
+            tag, path, error.response.status_code, error.response.text[:1000])
     else:
-        logger.debug("[_post] No bearer token provided, making unauthenticated request")
-
-    url = f"{base_url.rstrip('/')}/{path.lstrip('/')}"
-    logger.info(f"[_post] Making POST request to: {url}")
-    logger.debug(f"[_post] Request data: {data}")
-    logger.debug(f"[_post] Request params: {params}")
-
+        logger.exception("%s Unexpected error for %s", tag, path)
+
+
+class _ListBuilder:
+    """Builds the items of a list response, and picks up its total, from a single stream of ijson events"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.total = None
+        self._builder = None
+        self._depth = 0
+
+    def items(self, events: list) -> Iterator:
+        for path, event, value in events:
+            if self._builder is not None:
+                # Inside an item, until the container that started it is closed again
+                self._builder.event(event, value)
+                if event in ("start_map", "start_array"):
+                    self._depth += 1
+                elif event in ("end_map", "end_array"):
+                    self._depth -= 1
+                    if not self._depth:
+                        yield self._builder.value
+                        self._builder = None
+            elif path == self.prefix:
+                if event in ("start_map", "start_array"):
+                    self._builder = ijson.ObjectBuilder()
+                    self._builder.event(event, value)
+                    self._depth = 1
+                else:
+                    yield value
+            elif path == "total" and event == "number":
+                self.total = value
+        del events[:]
+
+
+async def _iter_items(path: str, bearer_token: str, prefix: str, params: dict = None,
+                      summary: dict = None) -> AsyncIterator[dict]:
+    # Parse the items of a list response incrementally as the body arrives, instead of buffering all of it.
+    # The total of the list response, when it has one, is stored in summary once the body is parsed.
+    tag = "[_iter_items]"
+    headers = _request_headers(bearer_token or "", False)
+    logger.info("%s Making GET request to: %s", tag, path)
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, headers=headers, json=data, params=params)
-            logger.info(f"[_post] Response status: {response.status_code} for URL: {url}")
-            
+        async with _http_client.stream("GET", path, headers=headers, params=params) as response:
+            logger.info("%s Response status: %d for path: %s", tag, response.status_code, path)
             if response.status_code >= 400:
-                logger.error(f"[_post] HTTP error {response.status_code}: {response.text[:500]}")
-            
+                # The error body is small, and it has to be read before it can be logged
+                await response.aread()
             response.raise_for_status()
-            return response.json()
-    except httpx.ConnectError as e:
-        logger.error(f"[_post] Connection error to {url}: {str(e)}")
-        logger.error(f"[_post] This usually means the backend service is not running or unreachable")
-        logger.error(f"[_post] Base URL: {base_url}, Path: {path}")
-        logger.error(f"[_post] Full traceback:\n{traceback.format_exc()}")
-        raise
-    except httpx.TimeoutException as e:
-        logger.error(f"[_post] Timeout error for {url}: {str(e)}")
-        logger.error(f"[_post] Full traceback:\n{traceback.format_exc()}")
-        raise
-    except httpx.HTTPStatusError as e:
-        logger.error(f"[_post] HTTP status error for {url}: {e.response.status_code}")
-        logger.error(f"[_post] Response body: {e.response.text[:1000]}")
-        logger.error(f"[_post] Full traceback:\n{traceback.format_exc()}")
-        raise
+            events = ijson.sendable_list()
+            parser = ijson.parse_coro(events, use_float=True)
+            builder = _ListBuilder(prefix)
+            async for chunk in response.aiter_bytes():
+                parser.send(chunk)
+                for item in builder.items(events):
+                    yield item
+            parser.close()
+            for item in builder.items(events):
+                yield item
+            if summary is not None and builder.total is not None:
+                summary["total"] = builder.total
     except Exception as e:
-        logger.error(f"[_post] Unexpected error for {url}: {type(e).__name__}: {str(e)}")
-        logger.error(f"[_post] Full traceback:\n{traceback.format_exc()}")
+        _log_request_error(tag, path, e)
         raise
 
 
-async def _patch(base_url: str, path: str, bearer_token: str, data: dict = None, params: dict = None) -> dict:
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
-    
-    # Only add Authorization header if token is provided and not empty
-    if bearer_token and bearer_token.strip():
-        headers["Authorization"] = f"Bearer {bearer_token}"
-        logger.debug(f"[_patch] Authorization header added (token length: {len(bearer_token)})")
-    else:
-        logger.debug("[_patch] No bearer token provided, making unauthenticated request")
+# GET requests in flight, so that concurrent identical reads share a single request
+_inflight: Dict[tuple, asyncio.Task] = {}
+
+
+async def _get(path: str, bearer_token: str, params: dict = None) -> dict:
+    key = _cache_key(path, bearer_token, params)
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(
+            _request("GET", path, bearer_token, params=params))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded, so that a cancelled caller doesn't cancel the request for the others
+    return await asyncio.shield(task)
+
+
+async def _post(path: str, bearer_token: str, data: dict = None, params: dict = None) -> dict:
+    return await _request("POST", path, bearer_token, data=data, params=params)
+
 
-    url = f"{base_url.rstrip('/')}/{path.lstrip('/')}"
-    logger.info(f"[_patch] Making PATCH request to: {url}")
-    logger.debug(f"[_patch] Request data: {data}")
-    logger.debug(f"[_patch] Request params: {params}")
+async def _patch(path: str, bearer_token: str, data: dict = None, params: dict = None) -> dict:
+    return await _write("PATCH", path, bearer_token, data=data, params=params)
 
+
+async def _write(method: str, path: str, bearer_token: str, data: dict = None, params: dict = None) -> dict:
+    # Writes, such as a new review or a cancelled booking, change what the cached reads return.
+    # Read-only POST endpoints, such as the hotel search, go through _post and keep the cache.
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.patch(url, headers=headers, json=data, params=params)
-            logger.info(f"[_patch] Response status: {response.status_code} for URL: {url}")
-            
-            if response.status_code >= 400:
-                logger.error(f"[_patch] HTTP error {response.status_code}: {response.text[:500]}")
-            
-            response.raise_for_status()
-            return response.json()
-    except httpx.ConnectError as e:
-        logger.error(f"[_patch] Connection error to {url}: {str(e)}")
-        logger.error(f"[_patch] This usually means the backend service is not running or unreachable")
-        logger.error(f"[_patch] Base URL: {base_url}, Path: {path}")
-        logger.error(f"[_patch] Full traceback:\n{traceback.format_exc()}")
-        raise
-    except httpx.TimeoutException as e:
-        logger.error(f"[_patch] Timeout error for {url}: {str(e)}")
-        logger.error(f"[_patch] Full traceback:\n{traceback.format_exc()}")
-        raise
-    except httpx.HTTPStatusError as e:
-        logger.error(f"[_patch] HTTP status error for {url}: {e.response.status_code}")
-        logger.error(f"[_patch] Response body: {e.response.text[:1000]}")
-        logger.error(f"[_patch] Full traceback:\n{traceback.format_exc()}")
-        raise
-    except Exception as e:
-        logger.error(f"[_patch] Unexpected error for {url}: {type(e).__name__}: {str(e)}")
-        logger.error(f"[_patch] Full traceback:\n{traceback.format_exc()}")
-        raise
+        return await _request(method, path, bearer_token, data=data, params=params)
+    finally:
+        cache_clear()
+
+
+# Limits the requests a batch helper has in flight at once, so that the hotel API is not overwhelmed
+_batch_semaphore = asyncio.Semaphore(16)
+
+
+async def _gather_limited(*calls) -> list:
+    async def run(call):
+        async with _batch_semaphore:
+            return await call
+
+    results = await asyncio.gather(*(run(call) for call in calls), return_exceptions=True)
+    # Report failed lookups in place, so that one missing record doesn't fail the whole batch
+    return [{"error": str(result)} if isinstance(result, Exception) else result for result in results]
+
+
+# Responses of the idempotent read endpoints, cached briefly as the agent tends to re-read the same records
+_response_cache: TTLCache = TTLCache(maxsize=1024, ttl=30)
+
+
+def _cache_key(path: str, bearer_token: str, params: dict = None) -> tuple:
+    # Key on a digest of the token rather than the raw secret
+    token_digest = hashlib.blake2b(bearer_token.encode(), digest_size=16).digest() if bearer_token else b""
+    # List values, such as amenities, are sent as repeated query parameters and have to be hashable here
+    params_key = tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                              for name, value in (params or {}).items()))
+    return path, params_key, token_digest
+
+
+async def _get_cached(path: str, bearer_token: str, params: dict = None) -> dict:
+    # The returned response is shared with later callers, so it must be treated as read-only
+    key = _cache_key(path, bearer_token, params)
+    response = _response_cache.get(key)
+    if response is None:
+        response = _response_cache[key] = await _get(path, bearer_token, params)
+    return response
+
+
+def cache_clear():
+    _response_cache.clear()
 
 
 async def fetch_hotels(token: OAuthToken = None, city: str = None, brand: str = None, amenities: list = None, limit: int = 20, offset: int = 0) -> dict:
 
-    path = "api/hotels"
-    params = {}
-    if city:
-        params['city'] = city
-    if brand:
-        params['brand'] = brand
-    if amenities:
-        params['amenities'] = amenities
-    if limit:
-        params['limit'] = limit
-    if offset:
-        params['offset'] = offset
-    bearer_token = token.access_token if token else ""
-    return await _get(hotel_api_base_url, path, bearer_token, params)
+    path = _PATH_HOTELS
+    params = {k: v for k, v in (("city", city), ("brand", brand), ("amenities", amenities),
+                                ("limit", limit), ("offset", offset)) if v}
+    bearer_token = _bearer(token)
+    return await _get(path, bearer_token, params)
 
 
 async def fetch_hotel_details(hotel_id: int, token: OAuthToken = None) -> dict:
 
     path = f"api/hotels/{hotel_id}"
-    bearer_token = token.access_token if token else ""
-    return await _get(hotel_api_base_url, path, bearer_token)
+    bearer_token = _bearer(token)
+    return await _get_cached(path, bearer_token)
 
 
 async def make_booking(hotel_id: int, room_id: int, check_in: str, check_out: str, guests: int,
                        user_id: str = None, special_requests: list = None, token: OAuthToken = None) -> dict:
-    path = "api/bookings"
+    path = _PATH_BOOKINGS
     data = {
         "hotel_id": hotel_id,
         "room_id": room_id,
         "check_in": check_in,
         "check_out": check_out,
-        "guests": guests
+        "guests": guests,
+        **{k: v for k, v in (("user_id", user_id), ("special_requests", special_requests)) if v}
     }
-    if user_id:
-        data["user_id"] = user_id
-    if special_requests:
-        data["special_requests"] = special_requests
     
-    return await _post(hotel_api_base_url, path, token.access_token, data)
+    return await _write("POST", path, token.access_token, data)
 
 
 # === HOTEL ENDPOINTS ===
@@ -221,24 +283,19 @@ async def make_booking(hotel_id: int, room_id: int, check_in: str, check_out: st
 async def search_hotels(location: str, check_in: str, check_out: str, guests: int = 1, 
                        rooms: int = 1, brand: str = None, amenities: list = None,
                        price_range: dict = None, token: OAuthToken = None) -> dict:
-    path = "api/hotels/search"
+    path = _PATH_HOTEL_SEARCH
     data = {
         "location": location,
         "check_in": check_in,
         "check_out": check_out,
         "guests": guests,
-        "rooms": rooms
+        "rooms": rooms,
+        **{k: v for k, v in (("brand", brand), ("amenities", amenities), ("price_range", price_range)) if v}
     }
-    if brand:
-        data["brand"] = brand
-    if amenities:
-        data["amenities"] = amenities
-    if price_range:
-        data["price_range"] = price_range
     
     # This is a public endpoint, but include token if available
-    bearer_token = token.access_token if token else ""
-    return await _post(hotel_api_base_url, path, bearer_token, data)
+    bearer_token = _bearer(token)
+    return await _post(path, bearer_token, data)
 
 
 async def fetch_hotel_reviews(hotel_id: int, limit: int = 10, rating: float = None, token: OAuthToken = None) -> dict:
@@ -248,16 +305,51 @@ async def fetch_hotel_reviews(hotel_id: int, limit: int = 10, rating: float = No
         params["rating"] = rating
     
     # This is a public endpoint, but include token if available
-    bearer_token = token.access_token if token else ""
-    return await _get(hotel_api_base_url, path, bearer_token, params)
+    bearer_token = _bearer(token)
+    return await _get_cached(path, bearer_token, params)
+
+
+async def iter_hotels(token: OAuthToken = None, city: str = None, brand: str = None, amenities: list = None,
+                      limit: int = 20, offset: int = 0, summary: dict = None) -> AsyncIterator[dict]:
+    params = {k: v for k, v in (("city", city), ("brand", brand), ("amenities", amenities),
+                                ("limit", limit), ("offset", offset)) if v}
+    async for hotel in _iter_items(_PATH_HOTELS, _bearer(token), "hotels.item", params, summary):
+        yield hotel
+
+
+async def fetch_hotels_with_reviews(city: str = None, brand: str = None, limit: int = 5, reviews_limit: int = 3,
+                                    token: OAuthToken = None) -> dict:
+    # Start fetching the reviews of each hotel as soon as it is parsed from the hotel list,
+    # so that the review requests run concurrently rather than one tool call at a time
+    hotels = []
+    review_tasks = []
+    summary = {}
+    try:
+        async for hotel in iter_hotels(token, city=city, brand=brand, limit=limit, summary=summary):
+            hotels.append(hotel)
+            review_tasks.append(
+                asyncio.ensure_future(fetch_hotel_reviews(hotel["id"], limit=reviews_limit, token=token)))
+    except Exception:
+        for task in review_tasks:
+            task.cancel()
+        raise
+    reviews = await asyncio.gather(*review_tasks, return_exceptions=True)
+    for hotel, hotel_reviews in zip(hotels, reviews):
+        # Report failed review lookups in place, as _gather_limited does, rather than failing the whole listing
+        hotel["reviews"] = {"error": str(hotel_reviews)} if isinstance(hotel_reviews, Exception) else hotel_reviews
+    return {"hotels": hotels, "total": summary.get("total", len(hotels))}
+
+
+async def fetch_many_hotel_details(hotel_ids: List[int], token: OAuthToken = None) -> list:
+    return await _gather_limited(*(fetch_hotel_details(hotel_id, token) for hotel_id in hotel_ids))
 
 
 # === BOOKING ENDPOINTS ===
 
 async def get_booking(booking_id: int, token: OAuthToken = None) -> dict:
     path = f"api/bookings/{booking_id}"
-    bearer_token = token.access_token if token else ""
-    return await _get(hotel_api_base_url, path, bearer_token)
+    bearer_token = _bearer(token)
+    return await _get(path, bearer_token)
 
 
 async def cancel_booking(booking_id: int, reason: str = None, token: OAuthToken = None) -> dict:
@@ -265,49 +357,46 @@ async def cancel_booking(booking_id: int, reason: str = None, token: OAuthToken
     data = {}
     if reason:
         data["reason"] = reason
-    return await _post(hotel_api_base_url, path, token.access_token, data)
+    return await _write("POST", path, token.access_token, data)
 
 
 # === REVIEW ENDPOINTS ===
 
 async def fetch_reviews(hotel_id: int = None, rating: float = None, limit: int = 20, 
                        offset: int = 0, token: OAuthToken = None) -> dict:
-    path = "api/reviews"
-    params = {"limit": limit, "offset": offset}
-    if hotel_id:
-        params["hotel_id"] = hotel_id
-    if rating:
-        params["rating"] = rating
+    path = _PATH_REVIEWS
+    params = {"limit": limit, "offset": offset,
+              **{k: v for k, v in (("hotel_id", hotel_id), ("rating", rating)) if v}}
     
     # This is a public endpoint, but include token if available
-    bearer_token = token.access_token if token else ""
-    return await _get(hotel_api_base_url, path, bearer_token, params)
+    bearer_token = _bearer(token)
+    return await _get_cached(path, bearer_token, params)
 
 
 async def create_review(booking_id: int, hotel_id: int, review_type: str, rating: float,
                        title: str, comment: str, staff_id: int = None, aspects: dict = None,
                        would_recommend: bool = None, token: OAuthToken = None) -> dict:
-    path = "api/reviews"
+    path = _PATH_REVIEWS
     data = {
         "booking_id": booking_id,
         "hotel_id": hotel_id,
         "review_type": review_type,
         "rating": rating,
         "title": title,
-        "comment": comment
+        "comment": comment,
+        **{k: v for k, v in (("staff_id", staff_id), ("aspects", aspects)) if v},
+        **({"would_recommend": would_recommend} if would_recommend is not None else {})
     }
-    if staff_id:
-        data["staff_id"] = staff_id
-    if aspects:
-        data["aspects"] = aspects
-    if would_recommend is not None:
-        data["would_recommend"] = would_recommend
     
-    return await _post(hotel_api_base_url, path, token.access_token, data)
+    return await _write("POST", path, token.access_token, data)
 
 
 async def get_review(review_id: int, token: OAuthToken = None) -> dict:
     path = f"api/reviews/{review_id}"
     # This is a public endpoint, but include token if available
-    bearer_token = token.access_token if token else ""
-    return await _get(hotel_api_base_url, path, bearer_token)
+    bearer_token = _bearer(token)
+    return await _get_cached(path, bearer_token)
+
+
+async def fetch_many_reviews(review_ids: List[int], token: OAuthToken = None) -> list:
+    return await _gather_limited(*(get_review(review_id, token) for review_id in review_ids))
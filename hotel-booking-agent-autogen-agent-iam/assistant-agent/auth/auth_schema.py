@@ -45,7 +45,7 @@ class AuthSchema:
         Raises:
             ValueError: If required components are missing for the token type
         """
-        if self.config.token_type == OAuthTokenType.OBO_TOKEN:
+        if self.config.token_type is OAuthTokenType.OBO_TOKEN:
             if not self.manager.get_message_handler():
                 raise ValueError(
                     "Message handler is required for OBO token authentication. "
@@ -9,8 +9,10 @@
   this license, please see the license as well as any agreement you’ve
   entered into with WSO2 governing the purchase of this software and any
 """
+import asyncio
 from enum import Enum
-from typing import List, Literal
+from functools import cached_property
+from typing import FrozenSet, List, Literal, NamedTuple, Tuple
 
 from pydantic import BaseModel, Field
 
@@ -36,6 +38,11 @@ class AuthConfig(BaseModel):
     class Config:
         frozen = True
 
+    @cached_property
+    def cache_key(self) -> Tuple[FrozenSet[str], OAuthTokenType]:
+        """Key of the tokens issued for this configuration, computed once per instance."""
+        return frozenset(self.scopes), self.token_type
+
 
 class AuthRequestMessage(BaseModel):
     """Message sent to request user authorization.
@@ -50,3 +57,18 @@ class AuthRequestMessage(BaseModel):
     auth_url: str
     state: str
     scopes: List[str]
+
+
+class PendingAuth(NamedTuple):
+    """User authorization awaiting its callback.
+    
+    Attributes:
+        scopes: OAuth scopes requested from the user
+        resource: Target resource for the token
+        future: Future resolved with the token once the callback is processed
+        code_verifier: PKCE code verifier of the authorization request
+    """
+    scopes: List[str]
+    resource: str
+    future: asyncio.Future
+    code_verifier: str
@@ -9,6 +9,7 @@
   this license, please see the license as well as any agreement you’ve
   entered into with WSO2 governing the purchase of this software and any
 """
+import copy
 import functools
 import inspect
 import logging
@@ -74,6 +75,16 @@ class SecureFunctionTool(FunctionTool):
         self._signature = inspect.signature(func)
         self._func = func
 
+    def with_auth(self, auth: AuthSchema) -> "SecureFunctionTool":
+        """Return a copy of the tool bound to the given auth context.
+
+        The schema inferred from the function signature is shared with the copy,
+        so tools can be built once and bound to each chat session cheaply.
+        """
+        tool = copy.copy(self)
+        tool.auth = auth
+        return tool
+
     async def run(self, args: BaseModel, cancellation_token: CancellationToken) -> Any:
         logger.info(f"[SecureFunctionTool] Starting execution of tool: {self.name}")
         logger.debug(f"[SecureFunctionTool] Tool args: {args}")
@@ -17,5 +17,5 @@ app.mount('/', StaticFiles(directory='static', html=True), name='static')
 if __name__ == '__main__':
     import uvicorn
 
-    uvicorn.run(app, port=8000)
+    uvicorn.run(app, port=8000, loop="uvloop")
 
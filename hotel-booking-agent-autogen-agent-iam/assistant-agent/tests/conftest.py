@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+
+import httpx
+import orjson
+import pytest
+
+from app import tools
+
+
+class MockHotelAPI:
+    """Serves canned hotel API responses by method and path, and records the requests it receives"""
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+    def route(self, method: str, path: str, body=None, status: int = 200):
+        # The body is either the JSON to return, or a callable building the response from the request
+        self.routes[(method, path)] = (body, status)
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        body, status = self.routes[(request.method, request.url.path)]
+        if callable(body):
+            return body(request)
+        return httpx.Response(status, content=orjson.dumps(body))
+
+    def calls(self, method: str, path: str) -> int:
+        return sum(1 for request in self.requests if (request.method, request.url.path) == (method, path))
+
+
+@pytest.fixture
+def hotel_api(monkeypatch):
+    api = MockHotelAPI()
+    monkeypatch.setattr(tools, "_http_client", httpx.AsyncClient(
+        base_url="http://hotel-api.test", transport=httpx.MockTransport(api.handler)))
+    tools.cache_clear()
+    tools._inflight.clear()
+    yield api
+    tools.cache_clear()
+
+
+@pytest.fixture
+def user_token():
+    # The tools only read the access token of an OAuthToken
+    return SimpleNamespace(access_token="user-token")
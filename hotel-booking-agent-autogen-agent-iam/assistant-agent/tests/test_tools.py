@@ -0,0 +1,224 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import orjson
+import pytest
+from cachetools import TTLCache
+
+from app import tools
+
+
+def test_fetch_hotels_with_amenities(hotel_api):
+    hotel_api.route("GET", "/api/hotels", {"hotels": [{"id": 1}], "total": 1})
+
+    async def run():
+        # Identical concurrent reads share a single request
+        return await asyncio.gather(
+            tools.fetch_hotels(city="Colombo", amenities=["Pool", "Spa"]),
+            tools.fetch_hotels(city="Colombo", amenities=["Pool", "Spa"]),
+        )
+
+    results = asyncio.run(run())
+
+    assert results == [{"hotels": [{"id": 1}], "total": 1}] * 2
+    assert len(hotel_api.requests) == 1
+    assert hotel_api.requests[0].url.params.get_list("amenities") == ["Pool", "Spa"]
+    assert hotel_api.requests[0].url.params["city"] == "Colombo"
+
+
+def test_search_keeps_cached_reads(hotel_api):
+    hotel_api.route("GET", "/api/hotels/1", {"id": 1, "name": "Gardeo Colombo"})
+    hotel_api.route("POST", "/api/hotels/search", {"hotels": []})
+
+    async def run():
+        await tools.fetch_hotel_details(1)
+        await tools.search_hotels("Colombo", "2025-10-01", "2025-10-03")
+        return await tools.fetch_hotel_details(1)
+
+    assert asyncio.run(run()) == {"id": 1, "name": "Gardeo Colombo"}
+    # The search is read-only, so the details are still served from the cache
+    assert hotel_api.calls("GET", "/api/hotels/1") == 1
+
+
+def test_writes_invalidate_cached_reads(hotel_api, user_token):
+    reviews = []
+    hotel_api.route("GET", "/api/reviews",
+                    lambda request: httpx.Response(200, json={"reviews": list(reviews)}))
+
+    def create(request):
+        reviews.append({"id": len(reviews) + 1})
+        return httpx.Response(201, json=reviews[-1])
+
+    hotel_api.route("POST", "/api/reviews", create)
+
+    async def run():
+        before = await tools.fetch_reviews(hotel_id=1)
+        await tools.create_review(1, 1, "hotel", 5, "Great", "Lovely stay", token=user_token)
+        return before, await tools.fetch_reviews(hotel_id=1)
+
+    before, after = asyncio.run(run())
+
+    assert before == {"reviews": []}
+    assert after == {"reviews": [{"id": 1}]}
+    assert hotel_api.calls("GET", "/api/reviews") == 2
+
+
+def _chunked(body: dict, size: int = 7):
+    # Small chunks split the items across reads, as a slow response body would
+    content = orjson.dumps(body)
+
+    async def stream():
+        for start in range(0, len(content), size):
+            yield content[start:start + size]
+
+    return lambda request: httpx.Response(200, content=stream())
+
+
+def test_fetch_hotels_with_reviews_keeps_total_and_reports_failures(hotel_api):
+    hotels = [{"id": 1, "amenities": ["Pool"], "location": {"city": "Colombo"}}, {"id": 2, "amenities": []}]
+    hotel_api.route("GET", "/api/hotels", _chunked({"hotels": hotels, "total": 12}))
+    hotel_api.route("GET", "/api/hotels/1/reviews", {"reviews": [{"id": 7}]})
+    hotel_api.route("GET", "/api/hotels/2/reviews", {"detail": "Not found"}, status=404)
+
+    result = asyncio.run(tools.fetch_hotels_with_reviews(limit=2))
+
+    assert result["total"] == 12
+    assert [hotel["id"] for hotel in result["hotels"]] == [1, 2]
+    assert result["hotels"][0]["amenities"] == ["Pool"]
+    assert result["hotels"][0]["location"] == {"city": "Colombo"}
+    assert result["hotels"][0]["reviews"] == {"reviews": [{"id": 7}]}
+    # A failed review lookup is reported in place, without failing the listing
+    assert "404" in result["hotels"][1]["reviews"]["error"]
+
+
+def test_fetch_hotels_with_reviews_without_total(hotel_api):
+    hotel_api.route("GET", "/api/hotels", _chunked({"hotels": [{"id": 1}]}))
+    hotel_api.route("GET", "/api/hotels/1/reviews", {"reviews": []})
+
+    result = asyncio.run(tools.fetch_hotels_with_reviews())
+
+    assert result == {"hotels": [{"id": 1, "reviews": {"reviews": []}}], "total": 1}
+
+
+def test_get_coalesces_identical_requests_in_flight(hotel_api):
+    release = asyncio.Event()
+
+    async def slow_response(request):
+        await release.wait()
+        return httpx.Response(200, json={"id": 3})
+
+    hotel_api.route("GET", "/api/bookings/3", slow_response)
+
+    async def run():
+        first = asyncio.ensure_future(tools._get("api/bookings/3", "user-token"))
+        second = asyncio.ensure_future(tools._get("api/bookings/3", "user-token"))
+        await asyncio.sleep(0)
+        # A cancelled caller doesn't cancel the shared request for the others
+        first.cancel()
+        release.set()
+        result = await second
+        await asyncio.sleep(0)
+        return first.cancelled(), result
+
+    assert asyncio.run(run()) == (True, {"id": 3})
+    assert hotel_api.calls("GET", "/api/bookings/3") == 1
+    # The request is no longer tracked once it has completed
+    assert not tools._inflight
+
+
+def test_get_does_not_coalesce_across_tokens(hotel_api):
+    hotel_api.route("GET", "/api/bookings/3",
+                    lambda request: httpx.Response(200, json={"auth": request.headers["Authorization"]}))
+
+    async def run():
+        return await asyncio.gather(tools._get("api/bookings/3", "token-a"), tools._get("api/bookings/3", "token-b"))
+
+    assert asyncio.run(run()) == [{"auth": "Bearer token-a"}, {"auth": "Bearer token-b"}]
+    assert hotel_api.calls("GET", "/api/bookings/3") == 2
+
+
+def test_get_cached_entries_expire(hotel_api, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(tools, "_response_cache", TTLCache(maxsize=1024, ttl=30, timer=lambda: now[0]))
+    hotel_api.route("GET", "/api/reviews/5", {"id": 5})
+
+    async def read():
+        return await tools.get_review(5)
+
+    asyncio.run(read())
+    now[0] = 29
+    asyncio.run(read())
+    assert hotel_api.calls("GET", "/api/reviews/5") == 1
+
+    now[0] = 31
+    assert asyncio.run(read()) == {"id": 5}
+    assert hotel_api.calls("GET", "/api/reviews/5") == 2
+
+
+def test_get_cached_entries_are_keyed_per_token(hotel_api):
+    hotel_api.route("GET", "/api/hotels/1",
+                    lambda request: httpx.Response(200, json={"auth": request.headers.get("Authorization")}))
+
+    async def run():
+        return [await tools.fetch_hotel_details(1, token) for token in
+                (SimpleNamespace(access_token="token-a"), SimpleNamespace(access_token="token-b"),
+                 SimpleNamespace(access_token="token-a"), None)]
+
+    assert asyncio.run(run()) == [{"auth": "Bearer token-a"}, {"auth": "Bearer token-b"},
+                                  {"auth": "Bearer token-a"}, {"auth": None}]
+    assert hotel_api.calls("GET", "/api/hotels/1") == 3
+    # Cache keys hold a digest of the token, never the token itself
+    assert not any("token-a" in repr(key) for key in tools._response_cache)
+
+
+def test_iter_hotels_yields_parsed_items_before_a_truncated_body_fails(hotel_api, caplog):
+    content = b'{"hotels": [{"id": 1}, {"id": 2}, {"id"'
+    hotel_api.route("GET", "/api/hotels", lambda request: httpx.Response(200, content=content))
+    hotels = []
+
+    async def run():
+        async for hotel in tools.iter_hotels():
+            hotels.append(hotel)
+
+    with pytest.raises(Exception):
+        asyncio.run(run())
+
+    assert hotels == [{"id": 1}, {"id": 2}]
+    assert "[_iter_items] Unexpected error for api/hotels" in caplog.text
+
+
+def test_iter_hotels_logs_stream_errors(hotel_api, caplog):
+    hotel_api.route("GET", "/api/hotels", {"detail": "Hotel API unavailable"}, status=503)
+
+    async def run():
+        return [hotel async for hotel in tools.iter_hotels()]
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(run())
+
+    assert "[_iter_items] HTTP status error for api/hotels: 503" in caplog.text
+    assert "Hotel API unavailable" in caplog.text
+
+
+def test_fetch_many_hotel_details_reports_failures_in_place(hotel_api):
+    hotel_api.route("GET", "/api/hotels/1", {"id": 1})
+    hotel_api.route("GET", "/api/hotels/2", {"detail": "Hotel not found"}, status=404)
+    hotel_api.route("GET", "/api/hotels/3", {"id": 3})
+
+    results = asyncio.run(tools.fetch_many_hotel_details([1, 2, 3]))
+
+    assert results[0] == {"id": 1}
+    assert "404" in results[1]["error"]
+    assert results[2] == {"id": 3}
+
+
+def test_fetch_many_reviews_keeps_the_order_of_the_ids(hotel_api):
+    for review_id in (4, 5, 6):
+        hotel_api.route("GET", f"/api/reviews/{review_id}", {"id": review_id})
+    hotel_api.route("GET", "/api/reviews/7", {"detail": "Internal error"}, status=500)
+
+    results = asyncio.run(tools.fetch_many_reviews([6, 7, 4, 5]))
+
+    assert [result.get("id") for result in results] == [6, None, 4, 5]
+    assert "500" in results[1]["error"]
@@ -1,11 +1,16 @@
 import os
 import json
 import time
+import hashlib
+import threading
+import functools
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from fastapi import Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, SecurityScopes
 import jwt
+from cachetools import TTLCache
 
 from pydantic import BaseModel
 
@@ -14,6 +19,10 @@ load_dotenv()
 
 security = HTTPBearer()
 
+# Validated tokens are cached for at most this many seconds, and never beyond their expiry
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '300'))
+TOKEN_CACHE_MAX_SIZE = int(os.getenv('TOKEN_CACHE_MAX_SIZE', '10000'))
+
 class Actor(BaseModel):
     sub: str | None = None
 
@@ -31,6 +40,8 @@ class JWKSClient:
         self.cache_ttl = cache_ttl
         self._jwks_cache: Optional[Dict[str, Any]] = None
         self._cache_timestamp: float = 0
+        # Tokens are verified on threadpool threads, which share this client
+        self._lock = threading.Lock()
     
     def _fetch_jwks(self) -> Dict[str, Any]:
         """Fetch JWKS from the JWKS URL"""
@@ -46,14 +57,16 @@ class JWKSClient:
     
     def get_jwks(self) -> Dict[str, Any]:
         """Get JWKS with caching"""
-        current_time = time.time()
-        
-        if (self._jwks_cache is None or 
-            current_time - self._cache_timestamp > self.cache_ttl):
-            self._jwks_cache = self._fetch_jwks()
-            self._cache_timestamp = current_time
-            
-        return self._jwks_cache
+        with self._lock:
+            current_time = time.time()
+
+            # Only one thread refreshes an expired key set; the others wait for it and reuse the result
+            if (self._jwks_cache is None or
+                current_time - self._cache_timestamp > self.cache_ttl):
+                self._jwks_cache = self._fetch_jwks()
+                self._cache_timestamp = current_time
+
+            return self._jwks_cache
     
     def get_signing_key(self, kid: str) -> str:
         """Get the signing key for a given key ID"""
@@ -88,8 +101,9 @@ class JWKSClient:
 
 
 # Initialize JWKS client
+@functools.lru_cache(maxsize=None)
 def get_jwks_client() -> JWKSClient:
-    """Get JWKS client instance"""
+    """Get the shared JWKS client instance, so that its key set cache outlives a request"""
     jwks_url = os.getenv('JWKS_URL')
     if not jwks_url:
         raise HTTPException(
@@ -101,6 +115,27 @@ def get_jwks_client() -> JWKSClient:
     return JWKSClient(jwks_url, cache_ttl)
 
 
+# Token digest -> (decoded token data, monotonic time until which it may be reused).
+# The cache evicts entries after TOKEN_CACHE_TTL; tokens expiring sooner are checked against their own expiry.
+_token_cache: TTLCache = TTLCache(maxsize=TOKEN_CACHE_MAX_SIZE, ttl=TOKEN_CACHE_TTL)
+
+
+def _token_cache_key(token: str) -> bytes:
+    """Key the cache on a digest of the token rather than the raw bearer secret"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _cache_token_data(key: bytes, token_data: TokenData, exp: Optional[int]) -> None:
+    """Cache decoded token data until the cache TTL or the token expiry, whichever comes first"""
+    ttl = TOKEN_CACHE_TTL
+    if exp is not None:
+        ttl = min(ttl, exp - time.time())
+    if ttl <= 0:
+        return
+
+    _token_cache[key] = (token_data, time.monotonic() + ttl)
+
+
 async def validate_token(
     security_scopes: SecurityScopes,
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -109,6 +144,30 @@ async def validate_token(
     Decode and validate JWT using JWKS for signature verification.
     """
     token = credentials.credentials
+    key = _token_cache_key(token)
+    cached = _token_cache.get(key)
+    if cached is not None and cached[1] > time.monotonic():
+        token_data = cached[0]
+    else:
+        # Fetching the key set and verifying the signature block, so keep them off the event loop
+        token_data, exp = await run_in_threadpool(_decode_token, token)
+        _cache_token_data(key, token_data, exp)
+    
+    # Check that the token has ALL the required scopes
+    for scope in security_scopes.scopes:
+        if scope not in token_data.scopes:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Insufficient permissions. Required scope: {scope}"
+            )
+
+    return token_data
+
+
+def _decode_token(token: str) -> Tuple[TokenData, Optional[int]]:
+    """
+    Verify the JWT signature and claims, and extract the token data along with the token expiry.
+    """
     jwks_client = get_jwks_client()
     issuer = os.getenv('JWT_ISSUER')  # Optional: for issuer validation
     
@@ -192,13 +251,5 @@ async def validate_token(
     token_scopes = payload.get("scope", "").split()
     if isinstance(payload.get("scope"), list):
         token_scopes = payload.get("scope", [])
-    
-    # Check that the token has ALL the required scopes
-    for scope in security_scopes.scopes:
-        if scope not in token_scopes:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Insufficient permissions. Required scope: {scope}"
-            )
 
-    return TokenData(sub=sub, act=act, scopes=token_scopes)
+    return TokenData(sub=sub, act=act, scopes=token_scopes), payload.get("exp")
@@ -2,11 +2,17 @@ import logging
 import os
 import uuid
 import hashlib
+import secrets
 import httpx
 import asyncio
+import functools
+from bisect import bisect_left, insort
+from itertools import islice
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Security, APIRouter, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from fastapi.responses import ORJSONResponse
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import date, datetime
 from .schemas import *
 from .dependencies import TokenData, validate_token
@@ -23,6 +29,9 @@ load_dotenv()
 # Staff Management Agent service configuration
 STAFF_MANAGEMENT_AGENT_URL = os.getenv('STAFF_MANAGEMENT_AGENT_URL', 'http://localhost:8002')
 AGENT_WEBHOOK_TIMEOUT = int(os.getenv('AGENT_WEBHOOK_TIMEOUT', '10'))  # seconds
+AGENT_WEBHOOK_QUEUE_SIZE = int(os.getenv('AGENT_WEBHOOK_QUEUE_SIZE', '1000'))
+AGENT_WEBHOOK_WORKERS = int(os.getenv('AGENT_WEBHOOK_WORKERS', '4'))
+AGENT_WEBHOOK_DRAIN_TIMEOUT = int(os.getenv('AGENT_WEBHOOK_DRAIN_TIMEOUT', '30'))  # seconds
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,54 +42,133 @@ logger = logging.getLogger(__name__)
 
 def log_request_details(request: Request, token_data: TokenData, extra_info: dict = None):
     """Enhanced logging function with structured information"""
-    endpoint = request.url.path
-    method = request.method
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
+    endpoint = request.scope["path"]
+    method = request.scope["method"]
     sub = token_data.sub
     act = token_data.act.sub if token_data.act else "N/A"
     
-    # Get client IP
-    client_ip = request.client.host if request.client else 'N/A'
-    
-    # Get user agent
-    user_agent = request.headers.get('user-agent', 'N/A')
-    
-    # Build log message
-    log_data = {
-        "method": method,
-        "endpoint": endpoint,
-        "client_ip": client_ip,
-        "user_id": sub,
-        "actor": act,
-        "user_agent": user_agent[:100] + "..." if len(user_agent) > 100 else user_agent
-    }
-    
-    # Add extra information if provided
-    if extra_info:
-        log_data.update(extra_info)
-    
     # Create structured log message
-    log_message = " | ".join([
-        f"{method} {endpoint}",
-        f"sub: {sub}",
-        f"act: {act}",
-    ])
+    log_message = f"{method} {endpoint} | sub: {sub} | act: {act}"
     
     # Add extra info to message if provided
     if extra_info:
-        extra_parts = []
-        for key, value in extra_info.items():
-            extra_parts.append(f"{key}: {value}")
-        if extra_parts:
-            log_message += " | " + " | ".join(extra_parts)
+        log_message += " | " + " | ".join(f"{key}: {value}" for key, value in extra_info.items())
     
     logger.info(log_message)
 
+# Confirmed stays per (hotel_id, room_id), as (check_in, check_out, booking_id) sorted by check-in, with
+# the dates as ordinal day numbers so that comparisons are plain int comparisons.
+# Confirmed stays of a room never overlap, so their check-outs are sorted as well.
+room_stays: Dict[Tuple[int, int], List[Tuple[int, int, int]]] = {}
+
+def _room_stay(booking: dict) -> Tuple[int, int, int]:
+    """Get the room index entry of a booking"""
+    return booking['check_in'].toordinal(), booking['check_out'].toordinal(), booking['id']
+
+def add_room_stay(booking: dict) -> None:
+    """Index a confirmed booking by its room"""
+    stays = room_stays.setdefault((booking['hotel_id'], booking['room_id']), [])
+    insort(stays, _room_stay(booking))
+
+def remove_room_stay(booking: dict) -> None:
+    """Remove a booking from the room index"""
+    stays = room_stays.get((booking['hotel_id'], booking['room_id']))
+    if stays:
+        stays.remove(_room_stay(booking))
+
+def is_room_available(hotel_id: int, room_id: int, check_in: date, check_out: date) -> bool:
+    """Check whether no confirmed booking of the room overlaps the given dates"""
+    stays = room_stays.get((hotel_id, room_id))
+    if not stays:
+        return True
+    # The last stay starting before check_out is the only one that can still overlap
+    index = bisect_left(stays, (check_out.toordinal(),))
+    return index == 0 or stays[index - 1][1] <= check_in.toordinal()
+
+for booking in bookings_data.values():
+    if booking['status'] == 'confirmed':
+        add_room_stay(booking)
+
+# Hotels and rooms without their images, as served by the public endpoints. The catalog
+# doesn't change at runtime, so these views are built once and shared between requests.
+hotels_view = {
+    hotel_id: {key: value for key, value in hotel_data.items() if key != 'images'}
+    for hotel_id, hotel_data in hotels_data.items()
+}
+rooms_view = {
+    hotel_id: {
+        room_id: {key: value for key, value in room_data.items() if key != 'images'}
+        for room_id, room_data in hotel_rooms.items()
+    }
+    for hotel_id, hotel_rooms in rooms_data.items()
+}
+
+# Hotel ids by lowercased city, brand and lowercased amenity, with each hotel's position in the catalog
+hotel_positions = {hotel_id: position for position, hotel_id in enumerate(hotels_data)}
+hotels_by_city: Dict[str, Set[int]] = {}
+hotels_by_brand: Dict[str, Set[int]] = {}
+hotels_by_amenity: Dict[str, Set[int]] = {}
+for hotel_id, hotel_data in hotels_data.items():
+    hotels_by_city.setdefault(hotel_data['address']['city'].lower(), set()).add(hotel_id)
+    hotels_by_brand.setdefault(hotel_data['brand'], set()).add(hotel_id)
+    for amenity in hotel_data['amenities']:
+        hotels_by_amenity.setdefault(amenity.lower(), set()).add(hotel_id)
+
+def find_hotel_ids(city: Optional[str] = None, brand: Optional[str] = None,
+                   amenities: Optional[List[str]] = None) -> List[int]:
+    """Get ids of hotels in a city (substring match), of a brand and with all amenities, in catalog order"""
+    filters = []
+    if city:
+        city = city.lower()
+        filters.append(set().union(*(ids for name, ids in hotels_by_city.items() if city in name)))
+    if brand:
+        filters.append(hotels_by_brand.get(brand, set()))
+    if amenities:
+        filters.extend(hotels_by_amenity.get(amenity.lower(), set()) for amenity in amenities)
+    
+    if not filters:
+        return list(hotels_data)
+    return sorted(set.intersection(*filters), key=hotel_positions.__getitem__)
+
+# Hotel-type reviews per hotel, sorted by creation date (oldest first), and the sum of their ratings
+hotel_reviews_by_hotel: Dict[int, List[dict]] = {}
+hotel_rating_sums: Dict[int, float] = {}
+
+def add_hotel_review(review: dict) -> None:
+    """Index a review of a hotel"""
+    hotel_id = review['hotel_id']
+    insort(hotel_reviews_by_hotel.setdefault(hotel_id, []), review, key=lambda r: r['created_at'])
+    hotel_rating_sums[hotel_id] = hotel_rating_sums.get(hotel_id, 0) + review['rating']
+
+# Number of reviews per hotel and rating value, so review summaries don't iterate over the reviews
+review_rating_counts: Dict[int, Dict[float, int]] = {}
+
+def count_review_rating(review: dict) -> None:
+    """Count a review towards the rating summaries"""
+    rating_counts = review_rating_counts.setdefault(review['hotel_id'], {})
+    rating_counts[review['rating']] = rating_counts.get(review['rating'], 0) + 1
+
+for review in reviews_data.values():
+    count_review_rating(review)
+    if review['review_type'] == 'hotel':
+        add_hotel_review(review)
+
+# Date of the last confirmation number and its formatted YYYYMMDD form
+_confirmation_date: Tuple[Optional[date], str] = (None, "")
+
 def generate_confirmation_number() -> str:
     """Generate a unique confirmation number"""
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    random_part = str(uuid.uuid4())[:8].upper()
-    return f"GRD-{timestamp[:8]}-{random_part}"
+    global _confirmation_date
+    today = date.today()
+    if today != _confirmation_date[0]:
+        _confirmation_date = (today, f"{today.year:04d}{today.month:02d}{today.day:02d}")
+    random_part = secrets.token_hex(4).upper()
+    return f"GRD-{_confirmation_date[1]}-{random_part}"
 
+@functools.lru_cache(maxsize=10_000)
 def anonymize_reviewer_name(user_id: str) -> str:
     """Generate anonymized reviewer name"""
     hash_obj = hashlib.md5(user_id.encode())
@@ -88,77 +176,99 @@ def anonymize_reviewer_name(user_id: str) -> str:
 
 def convert_review_to_public(review: dict) -> dict:
     """Convert internal review to public review format"""
-    public_review = review.copy()
-    # Remove sensitive fields
-    public_review.pop('booking_id', None)
-    public_review.pop('user_id', None)
-    # Add anonymized reviewer name
-    public_review['reviewer_name'] = anonymize_reviewer_name(review['user_id'])
-    return public_review
+    # Only the public fields are copied, leaving out sensitive ones such as booking_id and user_id
+    return {
+        'id': review['id'],
+        'hotel_id': review['hotel_id'],
+        'review_type': review['review_type'],
+        'rating': review['rating'],
+        'title': review['title'],
+        'comment': review['comment'],
+        'aspects': review['aspects'],
+        'would_recommend': review['would_recommend'],
+        'created_at': review['created_at'],
+        # Add anonymized reviewer name
+        'reviewer_name': anonymize_reviewer_name(review['user_id'])
+    }
+
+async def get_user_info(user_id: str) -> Optional[dict]:
+    """Get user details from Asgardeo SCIM API, falling back to local data"""
+    scim_user = await scim_service.get_user_info(user_id)
+    if scim_user:
+        return {
+            "id": scim_user['id'],
+            "email": scim_user['email'],
+            "first_name": scim_user['first_name'],
+            "last_name": scim_user['last_name'],
+            "display_name": scim_user['display_name'],
+            "source": scim_user['source']
+        }
+    if user_id in users_data:
+        # Fallback to local data
+        user_data = users_data[user_id]
+        return {
+            "id": user_data['id'],
+            "email": user_data['email'],
+            "first_name": user_data['first_name'],
+            "last_name": user_data['last_name'],
+            "display_name": f"{user_data['first_name']} {user_data['last_name']}",
+            "phone": user_data.get('phone'),
+            "loyalty_tier": user_data.get('loyalty_tier'),
+            "source": "local_data"
+        }
+    return None
+
+async def get_agent_info(agent_id: str) -> Optional[dict]:
+    """Get agent details from Asgardeo SCIM API, falling back to local data"""
+    scim_agent = await scim_service.get_agent_info(agent_id)
+    if scim_agent:
+        return {
+            "id": scim_agent['id'],
+            "display_name": scim_agent['display_name'],
+            "description": scim_agent['description'],
+            "ai_model": scim_agent['ai_model'],
+            "source": scim_agent['source']
+        }
+    if agent_id in users_data:
+        # Fallback to local data (treating as user for backward compatibility)
+        agent_data = users_data[agent_id]
+        return {
+            "id": agent_data['id'],
+            "email": agent_data['email'],
+            "first_name": agent_data['first_name'],
+            "last_name": agent_data['last_name'],
+            "display_name": f"{agent_data['first_name']} {agent_data['last_name']}",
+            "phone": agent_data.get('phone'),
+            "source": "local_data"
+        }
+    return None
+
+async def enrich_bookings_with_user_agent_info(bookings: List[dict]) -> List[dict]:
+    """Enrich bookings with user and agent details, looking up each distinct user and agent once"""
+    user_ids = list({booking['user_id'] for booking in bookings if booking.get('user_id')})
+    agent_ids = list({booking['agent_id'] for booking in bookings if booking.get('agent_id')})
+    
+    # Look up all users and agents concurrently
+    infos = await asyncio.gather(
+        *(get_user_info(user_id) for user_id in user_ids),
+        *(get_agent_info(agent_id) for agent_id in agent_ids)
+    )
+    user_infos = dict(zip(user_ids, infos[:len(user_ids)]))
+    agent_infos = dict(zip(agent_ids, infos[len(user_ids):]))
+    
+    return [
+        dict(
+            booking,
+            user_info=user_infos.get(booking.get('user_id')),
+            agent_info=agent_infos.get(booking.get('agent_id'))
+        )
+        for booking in bookings
+    ]
 
 async def enrich_booking_with_user_agent_info(booking: dict) -> dict:
     """Enrich booking data with user and agent details from Asgardeo SCIM API"""
-    enriched_booking = booking.copy()
-    
-    # Add user details
-    user_info = None
-    if booking.get('user_id'):
-        # Try SCIM API first, fallback to local data
-        scim_user = await scim_service.get_user_info(booking['user_id'])
-        if scim_user:
-            user_info = {
-                "id": scim_user['id'],
-                "email": scim_user['email'],
-                "first_name": scim_user['first_name'],
-                "last_name": scim_user['last_name'],
-                "display_name": scim_user['display_name'],
-                "source": scim_user['source']
-            }
-        elif booking['user_id'] in users_data:
-            # Fallback to local data
-            user_data = users_data[booking['user_id']]
-            user_info = {
-                "id": user_data['id'],
-                "email": user_data['email'],
-                "first_name": user_data['first_name'],
-                "last_name": user_data['last_name'],
-                "display_name": f"{user_data['first_name']} {user_data['last_name']}",
-                "phone": user_data.get('phone'),
-                "loyalty_tier": user_data.get('loyalty_tier'),
-                "source": "local_data"
-            }
-    
-    # Add agent details
-    agent_info = None
-    if booking.get('agent_id'):
-        # Try SCIM API first, fallback to local data
-        scim_agent = await scim_service.get_agent_info(booking['agent_id'])
-        if scim_agent:
-            agent_info = {
-                "id": scim_agent['id'],
-                "display_name": scim_agent['display_name'],
-                "description": scim_agent['description'],
-                "ai_model": scim_agent['ai_model'],
-                "source": scim_agent['source']
-            }
-        elif booking['agent_id'] in users_data:
-            # Fallback to local data (treating as user for backward compatibility)
-            agent_data = users_data[booking['agent_id']]
-            agent_info = {
-                "id": agent_data['id'],
-                "email": agent_data['email'],
-                "first_name": agent_data['first_name'],
-                "last_name": agent_data['last_name'],
-                "display_name": f"{agent_data['first_name']} {agent_data['last_name']}",
-                "phone": agent_data.get('phone'),
-                "source": "local_data"
-            }
-    
-    # Add enriched data to booking
-    enriched_booking['user_info'] = user_info
-    enriched_booking['agent_info'] = agent_info
-    
-    return enriched_booking
+    enriched_bookings = await enrich_bookings_with_user_agent_info([booking])
+    return enriched_bookings[0]
 
 async def invoke_staff_management_agent(booking_id: int, user_id: str, hotel_id: int, priority: str = "normal") -> None:
     """Invoke staff management agent for contact person assignment"""
@@ -181,18 +291,17 @@ async def invoke_staff_management_agent(booking_id: int, user_id: str, hotel_id:
         
         url = f"{STAFF_MANAGEMENT_AGENT_URL}/v1/invoke"
         
-        async with httpx.AsyncClient(timeout=AGENT_WEBHOOK_TIMEOUT) as client:
-            response = await client.post(
-                url,
-                json=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {access_token}"
-                }
-            )
-            response.raise_for_status()
-
-            logger.info(f"Invoked the staff management agent for booking {booking_id}")
+        response = await app.state.http_client.post(
+            url,
+            json=payload,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {access_token}"
+            }
+        )
+        response.raise_for_status()
+
+        logger.info(f"Invoked the staff management agent for booking {booking_id}")
             
     except httpx.TimeoutException:
         logger.error(f"Timeout for booking {booking_id} - staff management agent service may be unavailable")
@@ -201,10 +310,49 @@ async def invoke_staff_management_agent(booking_id: int, user_id: str, hotel_id:
     except Exception as e:
         logger.error(f"Failed to invoke staff management agent for booking {booking_id}: {str(e)}")
 
+async def staff_management_agent_webhook_worker(queue: asyncio.Queue) -> None:
+    """Invoke the staff management agent for queued bookings, one at a time"""
+    while True:
+        webhook = await queue.get()
+        try:
+            await invoke_staff_management_agent(**webhook)
+        finally:
+            queue.task_done()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Share one HTTP client, and its connection pool, across webhook calls made by a fixed set of workers"""
+    app.state.http_client = httpx.AsyncClient(
+        timeout=AGENT_WEBHOOK_TIMEOUT,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100)
+    )
+    app.state.webhook_queue = asyncio.Queue(maxsize=AGENT_WEBHOOK_QUEUE_SIZE)
+    app.state.accepting_webhooks = True
+    webhook_workers = [
+        asyncio.create_task(staff_management_agent_webhook_worker(app.state.webhook_queue))
+        for _ in range(AGENT_WEBHOOK_WORKERS)
+    ]
+    yield
+    # Stop taking new webhooks, then give the workers a bounded time to deliver the queued ones
+    app.state.accepting_webhooks = False
+    pending = app.state.webhook_queue.qsize()
+    if pending:
+        logger.info(f"Delivering {pending} queued auto-assign webhooks before shutdown")
+    try:
+        await asyncio.wait_for(app.state.webhook_queue.join(), timeout=AGENT_WEBHOOK_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error(f"{app.state.webhook_queue.qsize()} auto-assign webhooks were still queued at shutdown - webhooks dropped")
+    for worker in webhook_workers:
+        worker.cancel()
+    await asyncio.gather(*webhook_workers, return_exceptions=True)
+    await app.state.http_client.aclose()
+
 app = FastAPI(
     title="Hotel API",
     description="API for managing hotel bookings, reviews, and user interactions.",
-    version="2.1.0"
+    version="2.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 api_router = APIRouter(prefix="/api")
 
@@ -249,26 +397,11 @@ async def get_hotels(
     """Browse all hotels with filtering options - Public endpoint"""
     logger.info(f"GET /api/hotels - filters: city={city}, brand={brand}")
     
-    filtered_hotels = []
-    for hotel_id, hotel_data in hotels_data.items():
-        # Apply filters
-        if city and city.lower() not in hotel_data['address']['city'].lower():
-            continue
-        if brand and hotel_data['brand'] != brand:
-            continue
-        if amenities:
-            hotel_amenities = [a.lower() for a in hotel_data['amenities']]
-            if not all(amenity.lower() in hotel_amenities for amenity in amenities):
-                continue
-        
-        # Remove images from hotel data before creating Hotel object
-        hotel_data_clean = hotel_data.copy()
-        hotel_data_clean.pop('images', None)
-        filtered_hotels.append(Hotel(**hotel_data_clean))
+    hotel_ids = find_hotel_ids(city, brand, amenities)
     
-    # Apply pagination
-    total = len(filtered_hotels)
-    paginated_hotels = filtered_hotels[offset:offset + limit]
+    # Apply pagination, building models only for the returned page
+    total = len(hotel_ids)
+    paginated_hotels = [Hotel(**hotels_view[hotel_id]) for hotel_id in hotel_ids[offset:offset + limit]]
     
     return HotelsResponse(hotels=paginated_hotels, total=total)
 
@@ -282,38 +415,27 @@ async def search_hotels(
     
     # Filter hotels by location
     available_hotels = []
-    for hotel_id, hotel_data in hotels_data.items():
-        if search_request.location.lower() in hotel_data['address']['city'].lower():
-            # Get available rooms for this hotel
-            hotel_rooms = rooms_data.get(hotel_id, {})
-            available_rooms = []
-            
-            for room_id, room_data in hotel_rooms.items():
-                if room_data['max_occupancy'] >= search_request.guests:
-                    # Check room availability for dates
-                    is_available = True
-                    for booking in bookings_data.values():
-                        if (booking['hotel_id'] == hotel_id and 
-                            booking['room_id'] == room_id and
-                            booking['status'] == 'confirmed' and
-                            not (search_request.check_out <= booking['check_in'] or 
-                                 search_request.check_in >= booking['check_out'])):
-                            is_available = False
-                            break
-                    
-                    if is_available:
-                        room_with_availability = room_data.copy()
-                        room_with_availability.pop('images', None)  # Remove images
-                        room_with_availability['available'] = True
-                        room_with_availability['price_per_night'] = room_data['base_price']
-                        available_rooms.append(room_with_availability)
-            
-            if available_rooms:
-                hotel_with_rooms = hotel_data.copy()
-                hotel_with_rooms.pop('images', None)  # Remove images
-                hotel_with_rooms['available_rooms'] = available_rooms
-                hotel_with_rooms['lowest_rate'] = min(room['base_price'] for room in available_rooms)
-                available_hotels.append(hotel_with_rooms)
+    for hotel_id in find_hotel_ids(city=search_request.location):
+        # Get available rooms for this hotel
+        hotel_rooms = rooms_view.get(hotel_id, {})
+        available_rooms = []
+        
+        for room_id, room_data in hotel_rooms.items():
+            if room_data['max_occupancy'] >= search_request.guests:
+                # Check room availability for dates
+                if is_room_available(hotel_id, room_id, search_request.check_in, search_request.check_out):
+                    available_rooms.append(dict(
+                        room_data,
+                        available=True,
+                        price_per_night=room_data['base_price']
+                    ))
+        
+        if available_rooms:
+            available_hotels.append(dict(
+                hotels_view[hotel_id],
+                available_rooms=available_rooms,
+                lowest_rate=min(room['base_price'] for room in available_rooms)
+            ))
     
     search_id = str(uuid.uuid4())
     return {
@@ -332,19 +454,10 @@ async def get_hotel(
     if hotel_id not in hotels_data:
         raise HTTPException(status_code=404, detail="Hotel not found")
     
-    hotel_data_copy = hotels_data[hotel_id].copy()
-    
-    # Add rooms to hotel data (remove images from both hotel and rooms)
-    hotel_rooms = []
-    for room_id, room_data in rooms_data.get(hotel_id, {}).items():
-        room_data_clean = room_data.copy()
-        room_data_clean.pop('images', None)  # Remove images from room data
-        hotel_rooms.append(Room(**room_data_clean))
-    
-    hotel_data_copy['rooms'] = hotel_rooms
-    hotel_data_copy.pop('images', None)  # Remove images from hotel data
+    # Add rooms to hotel data (both without images)
+    hotel_rooms = [Room(**room_data) for room_data in rooms_view.get(hotel_id, {}).values()]
     
-    return Hotel(**hotel_data_copy)
+    return Hotel(**hotels_view[hotel_id], rooms=hotel_rooms)
 
 @api_router.get("/hotels/{hotel_id}/reviews", response_model=ReviewsResponse)
 async def get_hotel_reviews(
@@ -359,34 +472,35 @@ async def get_hotel_reviews(
     if hotel_id not in hotels_data:
         raise HTTPException(status_code=404, detail="Hotel not found")
     
-    # Filter reviews for this hotel
-    hotel_reviews = []
-    for review_id, review_data in reviews_data.items():
-        if (review_data['hotel_id'] == hotel_id and 
-            review_data['review_type'] == 'hotel'):
-            if rating is None or review_data['rating'] >= rating:
-                public_review = convert_review_to_public(review_data)
-                hotel_reviews.append(PublicReview(**public_review))
-    
-    # Sort by creation date (newest first)
-    hotel_reviews.sort(key=lambda x: x.created_at, reverse=True)
+    # Reviews for this hotel, newest first
+    hotel_reviews = hotel_reviews_by_hotel.get(hotel_id, [])
+    if rating is None:
+        total = len(hotel_reviews)
+        rating_sum = hotel_rating_sums.get(hotel_id, 0)
+        hotel_reviews = reversed(hotel_reviews)
+    else:
+        hotel_reviews = [review for review in reversed(hotel_reviews) if review['rating'] >= rating]
+        total = len(hotel_reviews)
+        rating_sum = sum(review['rating'] for review in hotel_reviews)
     
     # Apply limit
-    limited_reviews = hotel_reviews[:limit]
+    limited_reviews = [
+        PublicReview(**convert_review_to_public(review_data))
+        for review_data in islice(hotel_reviews, limit)
+    ]
     
     # Calculate summary
-    if hotel_reviews:
-        avg_rating = sum(r.rating for r in hotel_reviews) / len(hotel_reviews)
+    if total:
         summary = {
-            "average_rating": round(avg_rating, 2),
-            "total_reviews": len(hotel_reviews)
+            "average_rating": round(rating_sum / total, 2),
+            "total_reviews": total
         }
     else:
         summary = {"average_rating": 0, "total_reviews": 0}
     
     return ReviewsResponse(
         reviews=limited_reviews,
-        total=len(hotel_reviews),
+        total=total,
         summary=summary
     )
 
@@ -429,16 +543,12 @@ async def create_booking(
         )
     
     # Check room availability
-    for booking in bookings_data.values():
-        if (booking['hotel_id'] == booking_request.hotel_id and 
-            booking['room_id'] == booking_request.room_id and
-            booking['status'] == 'confirmed' and
-            not (booking_request.check_out <= booking['check_in'] or 
-                 booking_request.check_in >= booking['check_out'])):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Room is not available for the selected dates"
-            )
+    if not is_room_available(booking_request.hotel_id, booking_request.room_id,
+                             booking_request.check_in, booking_request.check_out):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Room is not available for the selected dates"
+        )
     
     # Calculate total amount
     days = (booking_request.check_out - booking_request.check_in).days
@@ -503,20 +613,26 @@ async def create_booking(
     }
     
     bookings_data[last_booking_id] = new_booking
+    add_room_stay(new_booking)
     
     # Fire webhook for automatic contact person assignment (async, don't wait)
     # Use priority based on guest count and created_by
     priority = "high" if booking_request.guests >= 3 or created_by == "agent" else "normal"
     
-    # Fire webhook in background - don't block the booking response
-    asyncio.create_task(invoke_staff_management_agent(
-        booking_id=last_booking_id,
-        user_id=user_id,
-        hotel_id=booking_request.hotel_id,
-        priority=priority
-    ))
-    
-    logger.info(f"Booking {last_booking_id} created successfully, auto-assign webhook queued")
+    # Queue webhook for the background workers - don't block the booking response
+    if not app.state.accepting_webhooks:
+        logger.error(f"Booking {last_booking_id} created during shutdown - auto-assign webhook dropped")
+        return Booking(**new_booking)
+    try:
+        app.state.webhook_queue.put_nowait({
+            "booking_id": last_booking_id,
+            "user_id": user_id,
+            "hotel_id": booking_request.hotel_id,
+            "priority": priority
+        })
+        logger.info(f"Booking {last_booking_id} created successfully, auto-assign webhook queued")
+    except asyncio.QueueFull:
+        logger.error(f"Booking {last_booking_id} created, but the auto-assign webhook queue is full - webhook dropped")
     
     return Booking(**new_booking)
 
@@ -558,6 +674,7 @@ async def cancel_booking(
     
     # Update booking status
     booking['status'] = 'cancelled'
+    remove_room_stay(booking)
     
     return Booking(**booking)
 
@@ -574,19 +691,16 @@ async def get_user_bookings(
     log_request_details(request, token_data, {"user_id": user_id})
     
 
-    user_bookings = []
-    for booking in bookings_data.values():
-        if booking['user_id'] == user_id:
-            if status is None or booking['status'] == status.value:
-                # Enrich booking with user and agent information
-                enriched_booking = await enrich_booking_with_user_agent_info(booking)
-                user_bookings.append(enriched_booking)
+    user_bookings = [
+        booking for booking in bookings_data.values()
+        if booking['user_id'] == user_id and (status is None or booking['status'] == status.value)
+    ]
     
     # Sort by creation date (newest first)
     user_bookings.sort(key=lambda x: x['created_at'], reverse=True)
     
-    # Apply limit
-    limited_bookings = user_bookings[:limit]
+    # Apply limit, and enrich only the returned bookings with user and agent information
+    limited_bookings = await enrich_bookings_with_user_agent_info(user_bookings[:limit])
     
     return {"bookings": limited_bookings, "total": len(user_bookings)}
 
@@ -633,29 +747,36 @@ async def get_reviews(
         if rating and review_data['rating'] < rating:
             continue
         
-        public_review = convert_review_to_public(review_data)
-        filtered_reviews.append(PublicReview(**public_review))
+        filtered_reviews.append(review_data)
     
     # Sort by creation date (newest first)
-    filtered_reviews.sort(key=lambda x: x.created_at, reverse=True)
+    filtered_reviews.sort(key=lambda x: x['created_at'], reverse=True)
     
-    # Apply pagination
+    # Apply pagination, building public reviews only for the returned page
     total = len(filtered_reviews)
-    paginated_reviews = filtered_reviews[offset:offset + limit]
+    paginated_reviews = [
+        PublicReview(**convert_review_to_public(review_data))
+        for review_data in filtered_reviews[offset:offset + limit]
+    ]
+    
+    # Calculate summary from the per-hotel rating counts
+    rating_counts = {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0}
+    rating_sum = 0
+    hotel_rating_counts = [review_rating_counts.get(hotel_id, {})] if hotel_id else review_rating_counts.values()
+    for counts in hotel_rating_counts:
+        for review_rating, count in counts.items():
+            if rating and review_rating < rating:
+                continue
+            rating_counts[str(int(review_rating))] += count
+            rating_sum += review_rating * count
     
-    # Calculate summary
-    if filtered_reviews:
-        avg_rating = sum(r.rating for r in filtered_reviews) / len(filtered_reviews)
-        rating_counts = {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0}
-        for review in filtered_reviews:
-            rating_counts[str(int(review.rating))] += 1
-        
+    if total:
         summary = {
-            "average_rating": round(avg_rating, 2),
+            "average_rating": round(rating_sum / total, 2),
             "total_by_rating": rating_counts
         }
     else:
-        summary = {"average_rating": 0, "total_by_rating": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0}}
+        summary = {"average_rating": 0, "total_by_rating": rating_counts}
     
     return ReviewsResponse(
         reviews=paginated_reviews,
@@ -710,6 +831,9 @@ async def create_review(
     }
     
     reviews_data[last_review_id] = new_review
+    count_review_rating(new_review)
+    if new_review['review_type'] == 'hotel':
+        add_hotel_review(new_review)
     
     return Review(**new_review)
 
@@ -13,7 +13,7 @@
 import os
 import httpx
 import logging
-from typing import Optional, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
 from datetime import datetime
 import asyncio
 from .jwt_client import jwt_client
@@ -32,6 +32,8 @@ class AsgardeoSCIMService:
         self._user_cache: Dict[str, Dict[str, Any]] = {}
         self._agent_cache: Dict[str, Dict[str, Any]] = {}
         self._cache_lock = asyncio.Lock()
+        # Lookups in progress, shared by concurrent callers asking for the same id
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
     
     async def _get_access_token(self) -> Optional[str]:
         """Get access token using shared JWT client"""
@@ -48,18 +50,37 @@ class AsgardeoSCIMService:
         
         return (datetime.now() - cached_at).total_seconds() < self._cache_ttl
     
-    async def _get_from_cache(self, cache: Dict[str, Dict[str, Any]], key: str) -> Optional[Dict[str, Any]]:
-        """Get item from cache if valid"""
+    async def _get_from_cache(self, cache: Dict[str, Dict[str, Any]], key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Get item from cache if valid, along with whether it was found (items may be cached as None)"""
         async with self._cache_lock:
             cached_item = cache.get(key)
             if self._is_cache_valid(cached_item):
                 logger.debug(f"Cache hit for {key}")
-                return cached_item.get('data')
+                return True, cached_item.get('data')
             elif cached_item:
                 # Remove expired cache entry
                 logger.debug(f"Cache expired for {key}, removing")
                 cache.pop(key, None)
-            return None
+            return False, None
+    
+    async def _get_or_fetch(
+        self,
+        cache: Dict[str, Dict[str, Any]],
+        key: str,
+        fetch: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+    ) -> Optional[Dict[str, Any]]:
+        """Get item from cache, or fetch it with a single request for all concurrent callers"""
+        found, data = await self._get_from_cache(cache, key)
+        if found:
+            return data
+        
+        inflight_key = (fetch.__name__, key)
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            task = self._inflight[inflight_key] = asyncio.ensure_future(fetch(key))
+            task.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        # Shielded, so that a cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(task)
     
     async def _set_cache(self, cache: Dict[str, Dict[str, Any]], key: str, data: Dict[str, Any]) -> None:
         """Set item in cache with timestamp"""
@@ -89,11 +110,14 @@ class AsgardeoSCIMService:
     
     async def get_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Fetch user information from Asgardeo SCIM Users API with caching"""
-        # Check cache first
-        cached_user = await self._get_from_cache(self._user_cache, user_id)
-        if cached_user:
-            return cached_user
-        
+        return await self._get_or_fetch(self._user_cache, user_id, self._fetch_user_info)
+    
+    async def get_agent_info(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch agent information from Asgardeo SCIM Agents API with caching"""
+        return await self._get_or_fetch(self._agent_cache, agent_id, self._fetch_agent_info)
+    
+    async def _fetch_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch user information from Asgardeo SCIM Users API and cache it"""
         access_token = await self._get_access_token()
         if not access_token:
             return None
@@ -143,13 +167,8 @@ class AsgardeoSCIMService:
             logger.error(f"Failed to fetch user info for {user_id}: {str(e)}")
             return None
     
-    async def get_agent_info(self, agent_id: str) -> Optional[Dict[str, Any]]:
-        """Fetch agent information from Asgardeo SCIM Agents API with caching"""
-        # Check cache first
-        cached_agent = await self._get_from_cache(self._agent_cache, agent_id)
-        if cached_agent:
-            return cached_agent
-        
+    async def _fetch_agent_info(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch agent information from Asgardeo SCIM Agents API and cache it"""
         access_token = await self._get_access_token()
         if not access_token:
             return None
@@ -13,12 +13,18 @@
 import os
 import httpx
 import logging
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime, timedelta
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Tokens are treated as expired this long before their actual expiry, but never more than half their lifetime
+TOKEN_EXPIRY_BUFFER = timedelta(seconds=300)
+# Cached tokens are refreshed in the background once they are this close to their (buffered) expiry,
+# but never earlier than a quarter of their buffered lifetime before it
+TOKEN_REFRESH_AHEAD = timedelta(seconds=120)
+
 class JWTTokenClient:
     """Generic JWT token client for OAuth2 client credentials flow"""
     
@@ -29,20 +35,37 @@ class JWTTokenClient:
         
         # Token caching
         self._tokens = {}  # scope -> token_data
-        self._token_lock = asyncio.Lock()
+        self._token_locks: Dict[str, asyncio.Lock] = {}  # scope -> lock serializing its token requests
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}  # scope -> background refresh in progress
         
         if not all([self.client_id, self.client_secret]):
             logger.warning("JWT client credentials not configured. Token requests will fail.")
     
+    def _is_token_valid(self, token_data: Optional[dict]) -> bool:
+        """Check if a cached token is still valid"""
+        return bool(token_data and
+                    token_data.get('expires_at') and
+                    datetime.now() < token_data['expires_at'])
+    
     async def get_access_token(self, scope: str) -> Optional[str]:
         """Get access token for specific scope using client credentials grant"""
-        async with self._token_lock:
-            # Check if we have a valid cached token for this scope
+        # Check if we have a valid cached token for this scope
+        token_data = self._tokens.get(scope)
+        if self._is_token_valid(token_data):
+            if datetime.now() >= token_data['refresh_at'] and scope not in self._refresh_tasks:
+                # Refresh ahead of expiry while the cached token is still served
+                task = self._refresh_tasks[scope] = asyncio.create_task(self._request_access_token(scope))
+                task.add_done_callback(lambda _: self._refresh_tasks.pop(scope, None))
+            logger.debug(f"Using cached token for scope: {scope}")
+            return token_data['access_token']
+        
+        return await self._request_access_token(scope)
+    
+    async def _request_access_token(self, scope: str) -> Optional[str]:
+        """Request a new access token for the scope, unless a concurrent request already renewed it"""
+        async with self._token_locks.setdefault(scope, asyncio.Lock()):
             token_data = self._tokens.get(scope)
-            if (token_data and 
-                token_data.get('expires_at') and 
-                datetime.now() < token_data['expires_at']):
-                logger.debug(f"Using cached token for scope: {scope}")
+            if self._is_token_valid(token_data) and datetime.now() < token_data['refresh_at']:
                 return token_data['access_token']
             
             if not all([self.client_id, self.client_secret]):
@@ -67,13 +90,17 @@ class JWTTokenClient:
                     access_token = token_response.get('access_token')
                     expires_in = token_response.get('expires_in', 3600)  # Default 1 hour
                     
-                    # Set expiration with 5-minute buffer
-                    expires_at = datetime.now() + timedelta(seconds=expires_in - 300)
+                    # Set expiration and the refresh time relative to the token lifetime, so that
+                    # short-lived tokens are not due for a refresh as soon as they are cached
+                    lifetime = timedelta(seconds=expires_in)
+                    expires_at = datetime.now() + lifetime - min(TOKEN_EXPIRY_BUFFER, lifetime / 2)
+                    refresh_at = expires_at - min(TOKEN_REFRESH_AHEAD, (expires_at - datetime.now()) / 4)
                     
                     # Cache the token for this scope
                     self._tokens[scope] = {
                         'access_token': access_token,
                         'expires_at': expires_at,
+                        'refresh_at': refresh_at,
                         'scope': scope
                     }
                     
@@ -95,11 +122,7 @@ class JWTTokenClient:
     
     def get_token_stats(self) -> dict:
         """Get token cache statistics for monitoring"""
-        valid_tokens = 0
-        for token_data in self._tokens.values():
-            if (token_data.get('expires_at') and 
-                datetime.now() < token_data['expires_at']):
-                valid_tokens += 1
+        valid_tokens = sum(1 for token_data in self._tokens.values() if self._is_token_valid(token_data))
         
         return {
             'total_cached_tokens': len(self._tokens),
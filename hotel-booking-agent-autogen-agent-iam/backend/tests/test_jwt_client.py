@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from app.services import jwt_client as jwt_client_module
+from app.services.jwt_client import JWTTokenClient
+
+
+@pytest.fixture
+def token_endpoint(monkeypatch):
+    """Mock IdP token endpoint, issuing short-lived tokens and recording the requests it receives"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"access_token": f"token-{len(requests)}", "expires_in": 60})
+
+    async_client = httpx.AsyncClient
+    monkeypatch.setattr(jwt_client_module.httpx, "AsyncClient",
+                        lambda: async_client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setenv("ASGARDEO_SCIM_CLIENT_ID", "client-id")
+    monkeypatch.setenv("ASGARDEO_SCIM_CLIENT_SECRET", "client-secret")
+    return requests
+
+
+def test_short_lived_token_is_not_refreshed_on_every_call(token_endpoint):
+    client = JWTTokenClient()
+
+    async def run():
+        tokens = [await client.get_access_token("invoke") for _ in range(5)]
+        # Give a refresh, had one been started, the chance to run
+        await asyncio.sleep(0)
+        return tokens
+
+    assert asyncio.run(run()) == ["token-1"] * 5
+    assert len(token_endpoint) == 1
+    token_data = client._tokens["invoke"]
+    assert datetime.now() < token_data["refresh_at"] < token_data["expires_at"]
+
+
+def test_token_is_refreshed_in_the_background_once_due(token_endpoint):
+    client = JWTTokenClient()
+
+    async def run():
+        await client.get_access_token("invoke")
+        client._tokens["invoke"]["refresh_at"] = datetime.now() - timedelta(seconds=1)
+        # The cached token is still served while the refresh runs
+        served = await client.get_access_token("invoke")
+        await asyncio.gather(*client._refresh_tasks.values())
+        return served, await client.get_access_token("invoke")
+
+    assert asyncio.run(run()) == ("token-1", "token-2")
+    assert len(token_endpoint) == 2
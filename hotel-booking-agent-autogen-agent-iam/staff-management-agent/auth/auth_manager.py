@@ -13,12 +13,16 @@ import asyncio
 import inspect
 import logging
 import secrets
-from typing import Awaitable, Callable, Dict, List, Optional, Tuple, get_type_hints
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, get_type_hints
 
 
-from .models import AuthConfig, AuthRequestMessage, OAuthTokenType
+from .models import AuthConfig, AuthRequestMessage, OAuthTokenType, PendingAuth
 from .token_manager import DEFAULT_TOKEN_STORE_MAX_SIZE, DEFAULT_TOKEN_STORE_TTL, TokenManager
 
+from cachetools import TTLCache
+
 from asgardeo.models import AsgardeoConfig, OAuthToken
 from asgardeo_ai.agent_auth_manager import AgentAuthManager
 from asgardeo_ai import AgentConfig
@@ -27,6 +31,14 @@ logger = logging.getLogger(__name__)
 
 # Configuration constants
 DEFAULT_AUTHORIZATION_TIMEOUT = 300  # 5 minutes in seconds
+DEFAULT_PENDING_AUTHS_MAX_SIZE = 1024
+DEFAULT_FAILED_FETCH_TTL = 2.0  # Seconds during which a failed token fetch is not retried
+AGENT_TOKEN_EXPIRY_SKEW = 30  # Seconds before expiry at which the agent token is treated as expired
+AGENT_TOKEN_REFRESH_AHEAD = 60  # Seconds before expiry at which the agent token is refreshed in the background
+
+# Code objects of message handlers that passed validation. Handlers are usually closures created
+# per chat session from the same function, so they share a code object and are only introspected once.
+_validated_handler_codes = set()
 
 class AutogenAuthManager:
     """Main authentication manager for handling OAuth flows and token management.
@@ -43,6 +55,7 @@ class AutogenAuthManager:
         token_store_maxsize: int = DEFAULT_TOKEN_STORE_MAX_SIZE,
         token_store_ttl: int = DEFAULT_TOKEN_STORE_TTL,
         authorization_timeout: int = DEFAULT_AUTHORIZATION_TIMEOUT,
+        pending_auths_maxsize: int = DEFAULT_PENDING_AUTHS_MAX_SIZE,
     ):
         """Initialize the authentication manager.
         
@@ -54,10 +67,16 @@ class AutogenAuthManager:
             token_store_maxsize: Maximum size of token cache
             token_store_ttl: Token cache TTL in seconds
             authorization_timeout: Timeout for authorization flows in seconds
+            pending_auths_maxsize: Maximum number of authorization flows awaiting their callback
         """
         self.authorization_timeout = authorization_timeout
-        self._pending_auths: Dict[str, Tuple[List[str], str, asyncio.Future, str]] = {}
+        self._pending_auths: "OrderedDict[str, PendingAuth]" = OrderedDict()
+        self._pending_auths_maxsize = pending_auths_maxsize
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # Keys of recently failed fetches, so that callers don't stampede a failing identity provider
+        self._failed_fetches = TTLCache(maxsize=token_store_maxsize, ttl=DEFAULT_FAILED_FETCH_TTL)
         self._message_handler = message_handler
+        self._has_message_handler = message_handler is not None
         self._token_manager = TokenManager(
             maxsize=token_store_maxsize,
             ttl=token_store_ttl
@@ -69,6 +88,10 @@ class AutogenAuthManager:
         )
         
         self.agent_token: Optional[OAuthToken] = None
+        self._agent_token_expiry: Optional[float] = None
+        self._agent_token_refresh: Optional[asyncio.Task] = None
+        # Created lazily, so that the manager is not bound to an event loop at construction
+        self._agent_token_lock: Optional[asyncio.Lock] = None
         self._validate()
 
     # Public API methods
@@ -90,21 +113,19 @@ class AutogenAuthManager:
         if token:
             return token
 
-        # Fetch new token
-        logger.debug("Fetching new %s for scopes %s", config.token_type.name, config.scopes)
-        
-        if config.token_type == OAuthTokenType.OBO_TOKEN:
-            token = await self._fetch_obo_token(config)
-        elif config.token_type == OAuthTokenType.AGENT_TOKEN:
-            token = await self._fetch_agent_token(config)
-        else:
-            raise ValueError(f"Unsupported token type: {config.token_type}")
+        key = config.cache_key
+        if key in self._failed_fetches:
+            logger.debug("Skipping fetch of %s after a recent failure", config.token_type.name)
+            return None
 
-        # Cache the token
-        if token:
-            self._token_manager.add_token(config, token)
-            
-        return token
+        # Concurrent requests for the same token share a single fetch, so the user
+        # is prompted only once per OBO authorization.
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._fetch_token(config))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded, so that a cancelled caller doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
 
     async def process_callback(self, state: str, code: str) -> OAuthToken:
         """Process OAuth authorization callback.
@@ -119,28 +140,48 @@ class AutogenAuthManager:
         Raises:
             ValueError: If state is invalid or authorization failed
         """
-        auth_data = self._pending_auths.pop(state, None)
-        if not auth_data:
-            logger.error(f"No pending authorization for state: {state}")
+        pending_auth = self._pending_auths.pop(state, None)
+        if not pending_auth:
+            logger.error("No pending authorization for state: %s", state)
             raise ValueError("Invalid state or no pending authorization")
 
-        scopes, resource, future, code_verifier = auth_data
-
+        future = pending_auth.future
         if future.done():
-            logger.error(f"Authorization already completed for state: {state}")
+            logger.error("Authorization already completed for state: %s", state)
             raise ValueError("Authorization already completed")
 
         try:
-            config = AuthConfig(scopes=scopes, token_type=OAuthTokenType.OBO_TOKEN, resource=resource)
-            token = await self._fetch_oauth_token(config, code=code, code_verifier=code_verifier)
+            # Fields come from an already validated AuthConfig, so validation is skipped
+            config = AuthConfig.model_construct(
+                scopes=pending_auth.scopes,
+                token_type=OAuthTokenType.OBO_TOKEN,
+                resource=pending_auth.resource
+            )
+            token = await self._fetch_oauth_token(config, code=code, code_verifier=pending_auth.code_verifier)
             future.set_result(token)
-            logger.info(f"Successfully obtained OBO token for scopes: {scopes}")
+            logger.info("Successfully obtained OBO token for scopes: %s", pending_auth.scopes)
             return token
         except Exception as e:
             future.set_exception(e)
-            logger.error(f"Error processing authorization callback: {e}")
+            logger.error("Error processing authorization callback: %s", e)
             raise
 
+    async def aclose(self) -> None:
+        """Cancel pending authorizations and any background agent token refresh.
+        
+        Waiters of the cancelled authorizations receive None, as for a timed out authorization.
+        """
+        pending = [pending_auth.future for pending_auth in self._pending_auths.values()]
+        self._pending_auths.clear()
+        if self._agent_token_refresh is not None:
+            pending.append(self._agent_token_refresh)
+            self._agent_token_refresh = None
+
+        for future in pending:
+            if not future.done():
+                future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
     def get_message_handler(self) -> Optional[Callable[[AuthRequestMessage], Awaitable[None]]]:
         """Get the registered message handler.
         
@@ -150,6 +191,39 @@ class AutogenAuthManager:
         return self._message_handler
 
     # Private helper methods
+    async def _fetch_token(self, config: AuthConfig) -> Optional[OAuthToken]:
+        """Fetch a new token for the configuration and cache it.
+        
+        Args:
+            config: Authentication configuration specifying token type and scopes
+            
+        Returns:
+            OAuth token if successful, None otherwise
+            
+        Raises:
+            ValueError: For unsupported token types
+        """
+        logger.debug("Fetching new %s for scopes %s", config.token_type.name, config.scopes)
+        
+        try:
+            if config.token_type is OAuthTokenType.OBO_TOKEN:
+                token = await self._fetch_obo_token(config)
+            elif config.token_type is OAuthTokenType.AGENT_TOKEN:
+                token = await self._fetch_agent_token(config)
+            else:
+                raise ValueError(f"Unsupported token type: {config.token_type}")
+        except Exception:
+            self._failed_fetches[config.cache_key] = True
+            raise
+
+        # Cache the token
+        if token:
+            self._token_manager.add_token(config, token)
+        else:
+            self._failed_fetches[config.cache_key] = True
+            
+        return token
+
     def _validate(self) -> None:
         """Validate the configuration and components."""
         self._validate_message_handler()
@@ -165,6 +239,29 @@ class AutogenAuthManager:
         if not inspect.iscoroutinefunction(self._message_handler):
             raise TypeError("message_handler must be an async function")
 
+        if not inspect.isfunction(self._message_handler):
+            # Other callables, such as bound methods or partials, need the full signature
+            self._validate_message_handler_signature()
+            return
+        code = self._message_handler.__code__
+        if code in _validated_handler_codes:
+            return
+
+        has_var_args = code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS)
+        if code.co_argcount != 1 or code.co_kwonlyargcount or has_var_args:
+            raise TypeError("message_handler must accept exactly one parameter")
+
+        param_type = self._message_handler.__annotations__.get(code.co_varnames[0])
+        if isinstance(param_type, str):
+            # Postponed annotations have to be resolved
+            param_type = get_type_hints(self._message_handler).get(code.co_varnames[0])
+        if param_type is not AuthRequestMessage:
+            raise TypeError(f"message_handler parameter must be of type AuthRequestMessage, not {param_type}")
+
+        _validated_handler_codes.add(code)
+
+    def _validate_message_handler_signature(self) -> None:
+        """Validate the parameters of a message handler that is not a plain function."""
         signature = inspect.signature(self._message_handler)
         params = list(signature.parameters.values())
 
@@ -176,11 +273,47 @@ class AutogenAuthManager:
             raise TypeError(f"message_handler parameter must be of type AuthRequestMessage, not {param_type}")
 
     async def _ensure_agent_token(self) -> OAuthToken:
-        """Ensure agent token is available, fetch if not present."""
-        if self.agent_token is None:
-            self.agent_token = await self._fetch_agent_token()
+        """Ensure agent token is available, fetch if not present or expired.
+        
+        A token close to expiry is still returned while a replacement is fetched in the background.
+        """
+        expiry = self._agent_token_expiry
+        if self.agent_token is None or (expiry is not None and time.monotonic() >= expiry):
+            await self._refresh_agent_token()
+        elif self._agent_token_needs_refresh() and (
+            self._agent_token_refresh is None or self._agent_token_refresh.done()
+        ):
+            self._agent_token_refresh = asyncio.create_task(self._refresh_agent_token())
+            self._agent_token_refresh.add_done_callback(self._log_agent_token_refresh_failure)
         return self.agent_token
 
+    def _agent_token_needs_refresh(self) -> bool:
+        """Check whether the agent token is missing or within the refresh window."""
+        if self.agent_token is None:
+            return True
+        expiry = self._agent_token_expiry
+        return expiry is not None and time.monotonic() >= expiry - AGENT_TOKEN_REFRESH_AHEAD
+
+    async def _refresh_agent_token(self) -> None:
+        """Fetch a new agent token unless another caller already refreshed it."""
+        if self._agent_token_lock is None:
+            self._agent_token_lock = asyncio.Lock()
+        # Concurrent callers wait for a single fetch
+        async with self._agent_token_lock:
+            if not self._agent_token_needs_refresh():
+                return
+            token = await self._fetch_agent_token()
+            self.agent_token = token
+            self._agent_token_expiry = (
+                time.monotonic() + token.expires_in - AGENT_TOKEN_EXPIRY_SKEW if token.expires_in else None
+            )
+
+    @staticmethod
+    def _log_agent_token_refresh_failure(task: asyncio.Task) -> None:
+        """Log the failure of a background agent token refresh."""
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Background agent token refresh failed: %s", task.exception())
+
     async def _fetch_agent_token(self, config: Optional[AuthConfig] = None) -> OAuthToken:
         """Fetch an agent token using agent credentials.
         
@@ -212,7 +345,7 @@ class AutogenAuthManager:
             ValueError: If required parameters are missing or token type is unsupported
         """
         try:
-            if config.token_type == OAuthTokenType.OBO_TOKEN:
+            if config.token_type is OAuthTokenType.OBO_TOKEN:
                 if not code:
                     raise ValueError("Authorization code is required for OBO token")
                 
@@ -222,12 +355,12 @@ class AutogenAuthManager:
                     agent_token=self.agent_token,
                     code_verifier=code_verifier
                 )
-            elif config.token_type == OAuthTokenType.AGENT_TOKEN:
+            elif config.token_type is OAuthTokenType.AGENT_TOKEN:
                 return await self._fetch_agent_token(config)
             else:
                 raise ValueError(f"Unsupported token type: {config.token_type}")
         except Exception as e:
-            logger.error(f"Error fetching {config.token_type} token: {e}")
+            logger.error("Error fetching %s token: %s", config.token_type, e)
             raise
 
     async def _fetch_obo_token(self, config: AuthConfig) -> Optional[OAuthToken]:
@@ -239,7 +372,7 @@ class AutogenAuthManager:
         Returns:
             OAuth token if authorization succeeds, None otherwise
         """
-        if not self._message_handler:
+        if not self._has_message_handler:
             logger.error("No message handler registered for OBO token flow")
             return None
 
@@ -250,12 +383,18 @@ class AutogenAuthManager:
             )
 
             # Create future to await authorization completion
-            future = asyncio.Future()
-            self._pending_auths[state] = (config.scopes, config.resource, future, code_verifier)
+            future = asyncio.get_running_loop().create_future()
+            self._pending_auths[state] = PendingAuth(config.scopes, config.resource, future, code_verifier)
+            # Abandoned flows are otherwise held until they time out, so evict the oldest beyond capacity
+            while len(self._pending_auths) > self._pending_auths_maxsize:
+                evicted_state, evicted = self._pending_auths.popitem(last=False)
+                logger.warning("Evicting pending authorization for state: %s", evicted_state)
+                if not evicted.future.done():
+                    evicted.future.cancel()
 
             # Notify client via handler
             await self._message_handler(
-                AuthRequestMessage(
+                AuthRequestMessage.model_construct(
                     auth_url=auth_url,
                     state=state,
                     scopes=config.scopes
@@ -264,15 +403,20 @@ class AutogenAuthManager:
 
             # Wait for authorization with timeout
             try:
-                token = await asyncio.wait_for(future, timeout=self.authorization_timeout)
-                return token
-            except asyncio.TimeoutError:
-                logger.warning(f"Authorization timed out for state: {state}")
+                async with asyncio.timeout(self.authorization_timeout):
+                    return await future
+            except TimeoutError:
+                logger.warning("Authorization timed out for state: %s", state)
                 self._cleanup_pending_auth(state)
                 return None
+            except asyncio.CancelledError:
+                # The pending authorization was evicted, unless this task itself is being cancelled
+                if asyncio.current_task().cancelling():
+                    raise
+                return None
                 
         except Exception as e:
-            logger.error(f"Error initiating OBO token flow: {e}")
+            logger.error("Error initiating OBO token flow: %s", e)
             return None
 
     def _cleanup_pending_auth(self, state: str) -> None:
@@ -281,10 +425,11 @@ class AutogenAuthManager:
         Args:
             state: OAuth state parameter to clean up
         """
-        if state in self._pending_auths:
-            _, _, future, _ = self._pending_auths.pop(state)
-            if not future.done():
-                future.cancel()
+        pending_auth = self._pending_auths.pop(state, None)
+        if pending_auth is None:
+            return
+        if not pending_auth.future.done():
+            pending_auth.future.cancel()
 
     @staticmethod
     def _create_state() -> str:
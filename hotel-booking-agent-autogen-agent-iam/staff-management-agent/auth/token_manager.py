@@ -78,5 +78,5 @@ class TokenManager:
         Returns:
             Tuple representing the cache key
         """
-        return (frozenset(config.scopes), config.token_type)
+        return config.cache_key
     
\ No newline at end of file
@@ -10,26 +10,32 @@
   entered into with WSO2 governing the purchase of this software and any
 """
 
+import asyncio
 import logging
 import os
-from typing import Literal, Dict
-
-from app.prompt import agent_system_prompt
-from app.tools import fetch_hotels, fetch_rooms, make_booking
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from string import Template
+from typing import AsyncIterator, Callable, List
+
+import orjson
+from app.prompt import get_system_prompt
+from app.tools import close_http_client, fetch_hotels, fetch_rooms, make_booking
 from autogen.extension import SecureFunctionTool
 from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import TextMessage
+from autogen_agentchat.base import Response
+from autogen_agentchat.messages import ModelClientStreamingChunkEvent, TextMessage
 from autogen_core import CancellationToken
 from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from fastapi import FastAPI, WebSocket, HTTPException
-from pydantic import BaseModel
 from sdk.auth import AuthRequestMessage, AuthManager, AuthSchema, AuthConfig, OAuthTokenType
 from starlette.responses import HTMLResponse
-from starlette.websockets import WebSocketDisconnect
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -44,12 +50,15 @@ redirect_url = os.environ.get('ASGARDEO_REDIRECT_URI', 'http://localhost:8000/ca
 azure_openai_endpoint = os.environ.get('AZURE_OPENAI_ENDPOINT')
 deployment_name = os.environ.get('AZURE_OPENAI_DEPLOYMENT_NAME')
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the pooled connections of the hotel API client
+    await close_http_client()
 
 
-class TextResponse(BaseModel):
-    type: Literal["message"] = "message"
-    content: str
+app = FastAPI(lifespan=lifespan)
 
 
 model_client = AzureOpenAIChatCompletionClient(
@@ -59,30 +68,131 @@ model_client = AzureOpenAIChatCompletionClient(
     model="gpt-4o"
 )
 
-auth_managers: Dict[str, AuthManager] = {}
-state_mapping: Dict[str, str] = {}
+# Streamed tokens are sent once this many characters are buffered or this many seconds passed
+DELTA_FLUSH_CHARS = 64
+DELTA_FLUSH_INTERVAL = 0.025
+
+# Seconds a chat session and a pending authorization flow are kept around
+SESSION_TTL = 12 * 60 * 60
+AUTH_FLOW_TTL = 10 * 60
+
+
+class SessionCache(TTLCache):
+    """Auth managers of the chat sessions, which are closed once evicted"""
+
+    def popitem(self):
+        session_id, auth_manager = super().popitem()
+        auth_manager.close()
+        return session_id, auth_manager
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for _, auth_manager in expired:
+            auth_manager.close()
+        return expired
 
 
-async def run_agent(assistant: AssistantAgent, websocket: WebSocket):
-    # Start the chat loop
-    while True:
-        user_input = await websocket.receive_text()
+# Bounded so that abandoned sessions and unfinished authorization flows are evicted.
+# Active sessions are kept alive, as every user message restarts the TTL of the session.
+auth_managers: SessionCache = SessionCache(maxsize=10_000, ttl=SESSION_TTL)
+state_mapping: TTLCache[str, str] = TTLCache(maxsize=10_000, ttl=AUTH_FLOW_TTL)
+
+# Create the set of tools once, as inferring their schemas is costly.
+# Each chat session binds its own auth context with SecureFunctionTool.with_auth.
+fetch_hotels_tool = SecureFunctionTool(
+    fetch_hotels,
+    description="Fetches all hotels and information about them",
+    name="FetchHotelsTool",
+    strict=True
+)
+
+fetch_hotel_rooms_tool = SecureFunctionTool(
+    fetch_rooms,
+    description="Fetch the rooms available, and information related such as price, amenities, etc.",
+    name="FetchHotelRoomsTool",
+    strict=True
+)
+
+book_hotel_tool = SecureFunctionTool(
+    make_booking,
+    description="Books the hotel room selected by the user.",
+    name="BookHotelTool",
+    strict=True
+)
 
-        if user_input.strip().lower() == "exit":
+
+async def send_message(websocket: WebSocket, message: dict):
+    # Serialize with orjson and send as a text frame, which the frontend parses with JSON.parse
+    await websocket.send_text(orjson.dumps(message).decode())
+
+
+async def stream_response(websocket: WebSocket, events: AsyncIterator) -> Response:
+    # Tokens are coalesced into fewer frames, flushed by size, by age or at any other event.
+    # The age deadline also holds while the model pauses, so buffered tokens are never held back for long.
+    response = None
+    buffer: List[str] = []
+    buffered = 0
+    deadline = 0.0
+
+    async def flush():
+        nonlocal buffered
+        if buffer:
+            await send_message(websocket, {"type": "delta", "content": "".join(buffer)})
+            buffer.clear()
+            buffered = 0
+
+    next_event = asyncio.ensure_future(anext(events))
+    try:
+        while True:
+            # Only buffered tokens have a deadline; otherwise wait for the next event for as long as it takes
+            timeout = max(0.0, deadline - time.monotonic()) if buffer else None
+            done, _ = await asyncio.wait((next_event,), timeout=timeout)
+            if not done:
+                await flush()
+                continue
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                break
+            next_event = asyncio.ensure_future(anext(events))
+
+            if isinstance(event, ModelClientStreamingChunkEvent):
+                if not buffer:
+                    deadline = time.monotonic() + DELTA_FLUSH_INTERVAL
+                buffer.append(event.content)
+                buffered += len(event.content)
+                if buffered < DELTA_FLUSH_CHARS and time.monotonic() < deadline:
+                    continue
+            elif isinstance(event, Response):
+                response = event
+            await flush()
+    finally:
+        next_event.cancel()
+    return response
+
+
+async def run_agent(assistant: AssistantAgent, websocket: WebSocket, keep_alive: Callable[[], None]):
+    # Start the chat loop, which ends when the client disconnects
+    async for user_input in websocket.iter_text():
+        keep_alive()
+
+        # Only short messages can be the exit command, so skip normalizing the rest
+        if len(user_input) < 16 and user_input.strip().lower() == "exit":
             await websocket.close()
             break
 
-        # Send the user message to the agent
-        response = await assistant.on_messages(
-            [TextMessage(content=user_input, source="user")], cancellation_token=CancellationToken())
+        # Send the user message to the agent and stream the generated tokens to the client
+        response = await stream_response(websocket, assistant.on_messages_stream(
+            [TextMessage(content=user_input, source="user")], cancellation_token=CancellationToken()))
 
         # Log the response
-        for i, msg in enumerate(response.inner_messages):
-            print(f"Step {i + 1}: {msg.content}")
-        print(f"Final Response: {response.chat_message.content}")
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, msg in enumerate(response.inner_messages):
+                logger.debug("Step %d: %s", i + 1, msg.content)
+            logger.debug("Final Response: %s", response.chat_message.content)
 
-        # Send the response back to the client
-        await websocket.send_json(TextResponse(content=response.chat_message.content).model_dump())
+        # Send the complete response back to the client
+        await send_message(websocket, {"type": "message", "content": response.chat_message.content})
 
 
 @app.websocket("/chat")
@@ -92,7 +202,7 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     # Create callback function to handle auth request redirects
     async def message_handler(message: AuthRequestMessage):
         state_mapping[message.state] = session_id
-        await websocket.send_json(message.model_dump())
+        await send_message(websocket, message.model_dump())
 
     # Create a auth manager instance for the chat session.
     # Auth manager is shared by all the tools in the session.
@@ -106,58 +216,55 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
     # Store the auth manager by session_id
     auth_managers[session_id] = auth_manager
 
-    # Create the set of tools required
-    fetch_hotels_tool = SecureFunctionTool(
-        fetch_hotels,
-        description="Fetches all hotels and information about them",
-        name="FetchHotelsTool",
-        auth=AuthSchema(auth_manager, AuthConfig(scopes=["read_hotels"],
-                                                 token_type=OAuthTokenType.CLIENT_TOKEN)),
-        strict=True
-    )
-
-    fetch_hotel_rooms_tool = SecureFunctionTool(
-        fetch_rooms,
-        description="Fetch the rooms available, and information related such as price, amenities, etc.",
-        name="FetchHotelRoomsTool",
-        auth=AuthSchema(auth_manager, AuthConfig(scopes=["read_rooms"])),
-        strict=True
-    )
-
-    book_hotel_tool = SecureFunctionTool(
-        make_booking,
-        description="Books the hotel room selected by the user.",
-        name="BookHotelTool",
-        auth=AuthSchema(auth_manager, AuthConfig(scopes=["create_bookings", "openid", "profile"],
-                                                 token_type=OAuthTokenType.OBO_TOKEN)),
-        strict=True
-    )
+    def keep_alive():
+        # Storing the auth manager again restarts the TTL of the session
+        auth_managers[session_id] = auth_manager
+
+    # Bind the tools to the auth manager of the chat session
+    tools = [
+        fetch_hotels_tool.with_auth(
+            AuthSchema(auth_manager, AuthConfig(scopes=["read_hotels"], token_type=OAuthTokenType.CLIENT_TOKEN))),
+        fetch_hotel_rooms_tool.with_auth(
+            AuthSchema(auth_manager, AuthConfig(scopes=["read_rooms"]))),
+        book_hotel_tool.with_auth(
+            AuthSchema(auth_manager, AuthConfig(scopes=["create_bookings", "openid", "profile"],
+                                                token_type=OAuthTokenType.OBO_TOKEN))),
+    ]
 
     # Create a agent instance for the chat session
     hotel_assistant = AssistantAgent(
         "hotel_booking_assistant",
         model_client=model_client,
-        tools=[fetch_hotels_tool, fetch_hotel_rooms_tool, book_hotel_tool],
+        tools=tools,
         reflect_on_tool_use=True,
-        system_message=agent_system_prompt)
+        model_client_stream=True,
+        system_message=get_system_prompt())
 
     # Initiate a web-socket connection
     await websocket.accept()
 
     try:
         # Welcome message
-        await websocket.send_json(TextResponse(
-            content="Welcome to Gardeo Hotel Booking! How can I help you today?"
-        ).model_dump())
+        await send_message(websocket, {
+            "type": "message",
+            "content": "Welcome to Gardeo Hotel Booking! How can I help you today?"
+        })
 
         # Continue to run the agent
-        await run_agent(hotel_assistant, websocket)
-    except WebSocketDisconnect:
-        print(f"Client with session_id {session_id} disconnected")
+        await run_agent(hotel_assistant, websocket, keep_alive)
+        # iter_text ends the chat loop quietly when the client disconnects
+        logger.info("Client with session_id %s disconnected", session_id)
     except Exception as e:
-        print(f"Error in WebSocket connection: {str(e)}")
+        logger.error("Error in WebSocket connection: %s", e)
     finally:
-        auth_managers.pop(session_id, None)
+        # A reconnect with the same session id may have registered a newer manager
+        if auth_managers.get(session_id) is auth_manager:
+            auth_managers.pop(session_id, None)
+        auth_manager.close()
+
+
+# The callback page is loaded once; only the token and the state are substituted per request
+callback_template = Template(Path(__file__).with_name("callback.html").read_text(encoding="utf-8"))
 
 
 @app.get("/callback")
@@ -178,52 +285,8 @@ async def callback(
         token = await auth_manager.process_callback(state, code)
 
         return HTMLResponse(
-            content=f"""
-            <html>
-            <head>
-                <title>Authorization Successful</title>
-                <script>
-                    function communicateAndClose() {{
-                        if (window.opener) {{
-                            try {{
-                                const message = {{
-                                    type: 'auth_callback',
-                                    token: {token.model_dump_json()},
-                                    state: '{state}'
-                                }};
-
-                                // Use postMessage to send token to opener
-                                window.opener.postMessage(message, "*");
-
-                                // Show success message
-                                document.getElementById('status').textContent = 'Authorization successful! Closing window...';
-
-                                // Close the window after a short delay
-                                setTimeout(function() {{
-                                    window.close();
-                                }}, 1500);
-                            }} catch (err) {{
-                                console.error('Error communicating with parent window:', err);
-                                document.getElementById('status').textContent = 'Error: ' + err.message;
-                            }}
-                        }} else {{
-                            document.getElementById('status').textContent = 'Cannot find opener window.';
-                        }}
-                    }}
-
-                    window.onload = communicateAndClose;
-                </script>
-            </head>
-            <body>
-                <div style="text-align: center; font-family: Arial, sans-serif; margin-top: 50px;">
-                    <h2>Authorization Successful</h2>
-                    <p id="status">Processing authorization...</p>
-                    <p>You can close this window and return to the booking assistant.</p>
-                </div>
-            </body>
-            </html>
-            """
+            content=callback_template.substitute(token=orjson.dumps(token.model_dump()).decode(), state=state)
         )
     except Exception as e:
-        logger.error(f"Error in callback: {str(e)}", exc_info=True)
+        logger.error("Error in callback: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -10,9 +10,13 @@
   entered into with WSO2 governing the purchase of this software and any
 """
 
+import asyncio
 import os
+from typing import Dict, Tuple
 
 import httpx
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 from sdk.auth import OAuthToken
@@ -22,6 +26,22 @@ load_dotenv()
 hotel_api_base_url = os.environ.get('HOTEL_API_BASE_URL')
 
 
+# HTTP client shared by all the tool calls, so that connections to the hotel API are reused
+_http_client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=20, max_connections=100))
+
+
+async def close_http_client():
+    await _http_client.aclose()
+
+
+class ToolError(httpx.HTTPStatusError):
+    """HTTP error with a compact message, which is what the agent gets to see for a failed tool call"""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"HTTP {response.status_code}: {response.text[:200]}",
+                         request=response.request, response=response)
+
+
 async def _get(base_url: str, path: str, bearer_token: str, params: dict = None) -> dict:
     headers = {
         "Authorization": f"Bearer {bearer_token}",
@@ -30,50 +50,76 @@ async def _get(base_url: str, path: str, bearer_token: str, params: dict = None)
 
     url = f"{base_url.rstrip('/')}/{path.lstrip('/')}"
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        return response.json()
+    response = await _http_client.get(url, headers=headers, params=params)
+    if response.status_code >= 400:
+        raise ToolError(response)
+    return orjson.loads(response.content)
+
+
+# Hotel and room listings change rarely, so their responses are cached for a short while
+_catalog_cache: TTLCache = TTLCache(maxsize=256, ttl=60)
+# Catalog requests in flight, so that concurrent misses for the same resource share a single request
+_catalog_inflight: Dict[Tuple, asyncio.Task] = {}
+
+
+async def _fetch_catalog(key: Tuple, base_url: str, path: str, bearer_token: str, params: dict = None) -> dict:
+    response = _catalog_cache[key] = await _get(base_url, path, bearer_token, params)
+    return response
+
+
+async def _get_cached(base_url: str, path: str, bearer_token: str, params: dict = None) -> dict:
+    key = (base_url, path, tuple(sorted((params or {}).items())))
+    response = _catalog_cache.get(key)
+    if response is not None:
+        return response
+
+    task = _catalog_inflight.get(key)
+    if task is None:
+        task = _catalog_inflight[key] = asyncio.ensure_future(
+            _fetch_catalog(key, base_url, path, bearer_token, params))
+        task.add_done_callback(lambda _: _catalog_inflight.pop(key, None))
+    # Shielded, so that a cancelled caller doesn't cancel the request for the others
+    return await asyncio.shield(task)
 
 
 async def fetch_hotels(token: OAuthToken) -> dict:
     path = "api/hotels"
-    return await _get(hotel_api_base_url, path, token.access_token)
+    return await _get_cached(hotel_api_base_url, path, token.access_token)
 
 
 async def fetch_rooms(hotel_id: int, token: OAuthToken) -> dict:
     path = f"api/hotels/{hotel_id}"
-    return await _get(hotel_api_base_url, path, token.access_token)
+    return await _get_cached(hotel_api_base_url, path, token.access_token)
 
 
 async def make_booking(hotel_id: int, room_id: int, date_from: str, date_to: str,  # used for API
                        hotel_name: str, total_cost: str,  # used for confirmation
                        token: OAuthToken  # used for authorization
                        ):
-    async with httpx.AsyncClient() as client:
-        # Set the authorization header with the access token
-        headers = {
-            "Authorization": f"Bearer {token.access_token}",
-            "Content-Type": "application/json"
-        }
-
-        # Prepare the booking data
-        booking_data = {
-            "hotel_id": hotel_id,
-            "room_id": room_id,
-            "check_in": date_from,
-            "check_out": date_to
-        }
-
-        # Make the POST request to the bookings endpoint
-        response = await client.post(
-            f"{hotel_api_base_url}/api/bookings",
-            json=booking_data,
-            headers=headers
-        )
-
-        # Raise an exception for HTTP errors
-        response.raise_for_status()
-
-        # Return the JSON response
-        return response.json()
+    # Set the authorization header with the access token
+    headers = {
+        "Authorization": f"Bearer {token.access_token}",
+        "Content-Type": "application/json"
+    }
+
+    # Prepare the booking data
+    booking_data = {
+        "hotel_id": hotel_id,
+        "room_id": room_id,
+        "check_in": date_from,
+        "check_out": date_to
+    }
+
+    # Make the POST request to the bookings endpoint
+    response = await _http_client.post(
+        f"{hotel_api_base_url}/api/bookings",
+        json=booking_data,
+        headers=headers
+    )
+
+    # Raise an exception for HTTP errors
+    if response.status_code >= 400:
+        raise ToolError(response)
+
+    # Return the JSON response
+    return orjson.loads(response.content)
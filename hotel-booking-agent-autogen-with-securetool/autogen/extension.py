@@ -9,12 +9,14 @@
   this license, please see the license as well as any agreement you’ve
   entered into with WSO2 governing the purchase of this software and any
 """
+import copy
 import functools
 import inspect
 import logging
 from collections import OrderedDict
 from typing import Any, Callable, Sequence, Optional
 
+import httpx
 from autogen_core import CancellationToken
 from autogen_core.code_executor import Import
 from autogen_core.tools import FunctionTool
@@ -73,6 +75,16 @@ class SecureFunctionTool(FunctionTool):
         self._signature = inspect.signature(func)
         self._func = func
 
+    def with_auth(self, auth: AuthSchema) -> "SecureFunctionTool":
+        """Return a copy of the tool bound to the given auth context.
+
+        The schema inferred from the function signature is shared with the copy,
+        so tools can be built once and bound to each chat session cheaply.
+        """
+        tool = copy.copy(self)
+        tool.auth = auth
+        return tool
+
     async def run(self, args: BaseModel, cancellation_token: CancellationToken) -> Any:
         # Skip auth if no auth context
         if not self.auth:
@@ -88,4 +100,10 @@ class SecureFunctionTool(FunctionTool):
         args = args.model_copy(update={TOKEN_FIELD: token})
 
         # Execute the tool
-        return await super().run(args, cancellation_token)
+        try:
+            return await super().run(args, cancellation_token)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 401:
+                # Drop the rejected token, so that the next call fetches a new one
+                self.auth.manager.invalidate_token(self.auth.config)
+            raise
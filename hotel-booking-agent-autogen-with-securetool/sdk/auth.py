@@ -71,20 +71,26 @@ class TokenManager:
     def __init__(self, maxsize=1000, ttl=3600):
         self.token_store = TTLCache(maxsize=maxsize, ttl=ttl)  # TTL in seconds
 
+    @staticmethod
+    def create_key(config: AuthConfig) -> Tuple[frozenset, OAuthTokenType]:
+        return frozenset(config.scopes), config.token_type
+
     def add_token(self, config: AuthConfig, token: OAuthToken):
-        key = (frozenset(config.scopes), config.token_type)
-        self.token_store[key] = token
+        self.token_store[self.create_key(config)] = token
 
     def get_token(self, config: AuthConfig) -> Optional[OAuthToken]:
-        key = (frozenset(config.scopes), config.token_type)
+        key = self.create_key(config)
         token = self.token_store.get(key)
 
         # clean the expired tokens
         if token and token.is_expired():
-            _ = self.token_store.pop(config)
+            _ = self.token_store.pop(key, None)
 
         return token
 
+    def remove_token(self, config: AuthConfig):
+        self.token_store.pop(self.create_key(config), None)
+
 
 class AuthManager:
     def __init__(
@@ -123,6 +129,9 @@ class AuthManager:
             ttl=token_store_ttl
         )
 
+        # Token requests in flight per auth config, removed once they complete
+        self._token_tasks: Dict[Tuple[frozenset, OAuthTokenType], asyncio.Task] = {}
+
         self._validate()
 
     def _validate(self):
@@ -173,7 +182,7 @@ class AuthManager:
         try:
             token = await client.refresh_token(self.token_endpoint, refresh_token)  # Passing as string
         except Exception as e:
-            logger.error(f"Failed to refresh token: {e}")
+            logger.error("Failed to refresh token: %s", e)
             raise
 
         return OAuthToken(**token)
@@ -202,7 +211,7 @@ class AuthManager:
             else:
                 raise ValueError(f"Unsupported token type: {config.token_type}")
         except Exception as e:
-            logger.error(f"Error fetching token: {e}")
+            logger.error("Error fetching token: %s", e)
             raise
 
         return OAuthToken(**token)
@@ -219,7 +228,7 @@ class AuthManager:
             Optional[OAuthToken]: The token received upon user authorization, or None if it fails or times out.
         """
         if not self._message_handler:
-            logger.error(f"[Authorization Error] No message handler registered.")
+            logger.error("[Authorization Error] No message handler registered.")
             return None
 
         state = self._create_state()
@@ -253,10 +262,10 @@ class AuthManager:
             token = await asyncio.wait_for(future, timeout=self.authorization_timeout)
             return token
         except asyncio.TimeoutError:
-            logger.warning(f"Authorization timed out for session {state}")
+            logger.warning("Authorization timed out for session %s", state)
             # Clean up the pending auth
             if state in self._pending_auths:
-                future = self._pending_auths.pop(state)
+                _, future = self._pending_auths.pop(state)
                 if not future.done():
                     future.cancel()
             return None
@@ -274,13 +283,27 @@ class AuthManager:
 
         # Check if a valid token exists already
         token = self._token_manager.get_token(config)
+        if token and not token.is_expired():
+            return token
 
-        # If a token exits, check if it is expired
-        if token and token.is_expired():
-            # If the token is expired, try refreshing it
+        # Concurrent tool calls with the same config wait for a single token request,
+        # instead of each fetching (or prompting the user for) its own token
+        key = TokenManager.create_key(config)
+        task = self._token_tasks.get(key)
+        if task is None:
+            task = self._token_tasks[key] = asyncio.ensure_future(self._acquire_token(config, token))
+            task.add_done_callback(lambda _: self._token_tasks.pop(key, None))
+        # Shielded, so that a cancelled tool call doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def _acquire_token(self, config: AuthConfig, token: Optional[OAuthToken]) -> OAuthToken:
+        # If a token exits, it is expired, so try refreshing it
+        if token:
             logger.debug("Token expired. Attempting to refresh %s for the scopes %s", config.token_type.name,
                          config.scopes)
             token = await self._refresh_oauth_token(token.refresh_token, config.scopes)
+            if token:
+                self._token_manager.add_token(config, token)
 
         # If token is available then return
         if token:
@@ -299,12 +322,32 @@ class AuthManager:
             self._token_manager.add_token(config, token)
         return token
 
+    def invalidate_token(self, config: AuthConfig):
+        """
+        Removes the cached token for the given config, e.g. when it is rejected by the API
+
+        Args:
+            config (AuthConfig): The auth configuration
+        """
+        self._token_manager.remove_token(config)
+
+    def close(self):
+        """
+        Cancels the pending authorizations and token requests, e.g. once the chat session has ended
+        """
+        for _, future in self._pending_auths.values():
+            if not future.done():
+                future.cancel()
+        self._pending_auths.clear()
+        for task in list(self._token_tasks.values()):
+            task.cancel()
+
     async def process_callback(self, state: str, code: str) -> OAuthToken:
 
         scopes, future = self._pending_auths.pop(state, None)
 
         if not future and future.done():
-            logger.error(f"No pending authorization for state: {state}")
+            logger.error("No pending authorization for state: %s", state)
             raise ValueError(f"Invalid state or no pending authorization.")
 
         try:
@@ -315,7 +358,7 @@ class AuthManager:
             return token
         except Exception as e:
             future.set_exception(e)
-            logger.error(f"Error fetching token: {e}")
+            logger.error("Error fetching token: %s", e)
             raise
 
 